@@ -0,0 +1,153 @@
+"""Batch driver: exports every .blend file in a folder with background Blender instances.
+
+    python bakin_batch_export.py assets/ --blender /path/to/blender --jobs 4 --summary summary.json
+
+Each file runs `blender -b <file> --python bakin_model_exporter.py -- ...` in its own process,
+so several Blender instances export in parallel. Per-file status and timings are collected into
+a summary printed at the end (and written as JSON with --summary).
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+EXPORTER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bakin_model_exporter.py")
+INVERTIBLE_TEXTURES = ('roughness', 'metallic', 'emissive', 'specular')
+
+def find_blend_files(paths, recursive=False):
+    blend_files = []
+    for path in paths:
+        if os.path.isfile(path):
+            blend_files.append(os.path.abspath(path))
+            continue
+        for root, dirs, files in os.walk(path):
+            blend_files.extend(os.path.join(root, name) for name in sorted(files) if name.endswith(".blend"))
+            if not recursive:
+                break
+    return sorted(blend_files)
+
+def export_command(args, blend_file, status_file):
+    model_name = os.path.splitext(os.path.basename(blend_file))[0]
+    command = [
+        args.blender, "-b", blend_file, "--factory-startup",
+        "--python", EXPORTER_SCRIPT, "--",
+        "--status-file", status_file,
+    ]
+    if args.name_from_file:
+        command += ["--model-name", model_name]
+    if args.output_root:
+        command += ["--output-dir", os.path.join(os.path.abspath(args.output_root), model_name)]
+    for texture in INVERTIBLE_TEXTURES:
+        invert = getattr(args, f"invert_{texture}")
+        if invert is not None:
+            command.append(f"--invert-{texture}" if invert else f"--no-invert-{texture}")
+    for option in ("no_cache", "power_of_two", "check_only"):
+        if getattr(args, option):
+            command.append("--" + option.replace('_', '-'))
+    if args.threads is not None:
+        command += ["--threads", str(args.threads)]
+    if args.max_texture_size is not None:
+        command += ["--max-texture-size", str(args.max_texture_size)]
+    if args.keyframe_tolerance is not None:
+        command += ["--keyframe-tolerance", str(args.keyframe_tolerance)]
+    if args.lod_ratios:
+        command += ["--lod-ratios", args.lod_ratios]
+    return command
+
+def export_file(args, blend_file):
+    # One background Blender per file; the exporter reports back through a JSON status file
+    fd, status_file = tempfile.mkstemp(prefix="bakin_status_", suffix=".json")
+    os.close(fd)
+    status = {'blend_file': blend_file, 'result': 'FAILED'}
+    start = time.perf_counter()
+    try:
+        process = subprocess.run(
+            export_command(args, blend_file, status_file),
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            timeout=args.timeout or None,
+        )
+        status['returncode'] = process.returncode
+        try:
+            with open(status_file, 'r', encoding='utf-8') as f:
+                status.update(json.load(f))
+        except (OSError, ValueError):
+            status['error'] = "Blender exited without reporting a status"
+        if status['result'] != 'FINISHED':
+            status['log'] = process.stdout.decode(errors='replace').splitlines()[-20:]
+    except subprocess.TimeoutExpired:
+        status['error'] = f"timed out after {args.timeout} seconds"
+    except OSError as e:
+        status['error'] = f"could not start Blender: {e}"
+    finally:
+        os.remove(status_file)
+    status['wall_seconds'] = time.perf_counter() - start
+    return status
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export many .blend files to FBX + DEF for BAKIN in parallel.")
+    parser.add_argument("paths", nargs='+', help=".blend files or folders containing them.")
+    parser.add_argument("--blender", default=os.environ.get("BLENDER", "blender"), help="Blender executable.")
+    parser.add_argument("--jobs", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Number of Blender instances running at once.")
+    parser.add_argument("--recursive", action="store_true", help="Also search sub-folders.")
+    parser.add_argument("--output-root", help="Export each model to <output-root>/<name> instead of next to its .blend.")
+    parser.add_argument("--threads", type=int, help="Texture encoding threads per Blender instance.")
+    parser.add_argument("--max-texture-size", type=int, help="Scale textures and mask maps down to at most this many pixels.")
+    parser.add_argument("--power-of-two", action="store_true", help="Snap exported texture sizes to powers of two.")
+    parser.add_argument("--keyframe-tolerance", type=float, help="Reduce animation keyframes within this tolerance before export.")
+    parser.add_argument("--lod-ratios", help="Also export decimated LODs keeping these shares of triangles, e.g. 0.5,0.25.")
+    parser.add_argument("--timeout", type=float, default=0, help="Seconds before a single export is killed (0 = none).")
+    parser.add_argument("--name-from-file", action="store_true",
+                        help="Name each model after its .blend file instead of the name saved in its scene.")
+    # Without --invert-* or --no-invert-*, every file keeps the inversions saved in its scene
+    for texture in INVERTIBLE_TEXTURES:
+        parser.add_argument(f"--invert-{texture}", dest=f"invert_{texture}", action="store_true", default=None)
+        parser.add_argument(f"--no-invert-{texture}", dest=f"invert_{texture}", action="store_false", default=None)
+    parser.add_argument("--no-cache", action="store_true", help="Rewrite every file, even unchanged ones.")
+    parser.add_argument("--check-only", action="store_true", help="Only run the exporter's pre-flight check on every file.")
+    parser.add_argument("--summary", help="Write the per-file results as JSON to this path.")
+    args = parser.parse_args(argv)
+
+    blend_files = find_blend_files(args.paths, args.recursive)
+    if not blend_files:
+        print("No .blend files found.")
+        return 1
+
+    start = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [executor.submit(export_file, args, blend_file) for blend_file in blend_files]
+        for future in as_completed(futures):
+            status = future.result()
+            results.append(status)
+            print(f"[{len(results)}/{len(blend_files)}] {status['result']:<8} {status['wall_seconds']:7.1f}s  "
+                  f"{status['blend_file']}" + (f"  ({status['error']})" if status.get('error') else ""))
+
+    results.sort(key=lambda status: status['blend_file'])
+    failed = [status for status in results if status['result'] != 'FINISHED']
+    summary = {
+        'files': len(results),
+        'finished': len(results) - len(failed),
+        'failed': len(failed),
+        'wall_seconds': time.perf_counter() - start,
+        'export_seconds': sum(status.get('seconds', 0.0) for status in results),
+        'results': results,
+    }
+    print(f"{summary['finished']}/{summary['files']} exported in {summary['wall_seconds']:.1f}s "
+          f"({summary['export_seconds']:.1f}s of export time across {args.jobs} instances).")
+    for status in failed:
+        print(f"FAILED: {status['blend_file']}: {status.get('error', 'unknown error')}")
+
+    if args.summary:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=1)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
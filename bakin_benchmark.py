@@ -0,0 +1,235 @@
+"""Performance benchmark for the Bakin exporter, run inside a background Blender (no GPU needed):
+
+    blender -b --factory-startup --python bakin_benchmark.py -- --scales small,medium \
+        --output results.json --baseline baseline.json
+
+Each scale procedurally builds a scene (materials, texture resolution, node-graph depth, objects and
+mesh density), saves it to a temporary folder and times a cold export, a warm re-export with the
+export cache, generate_unity_mask_map and write_def_file. Results are written as stable, sorted JSON.
+Timed runs are never traced; --trace-memory adds separate tracemalloc runs for peak memory.
+With --baseline, every metric is compared against a previous results file and the exit code is 1
+when one is slower or bigger than the baseline by more than --tolerance.
+"""
+
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import bpy
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import bakin_model_exporter as exporter
+
+SCALES = {
+    'small': {'materials': 4, 'texture_size': 256, 'node_depth': 1, 'objects': 4, 'grid': 32},
+    'medium': {'materials': 16, 'texture_size': 1024, 'node_depth': 4, 'objects': 16, 'grid': 128},
+    'large': {'materials': 32, 'texture_size': 1024, 'node_depth': 8, 'objects': 64, 'grid': 256},
+    'huge_textures': {'materials': 4, 'texture_size': 8192, 'node_depth': 1, 'objects': 4, 'grid': 32},
+    'dense_meshes': {'materials': 4, 'texture_size': 256, 'node_depth': 1, 'objects': 8, 'grid': 768},
+}
+
+# Metrics where a larger number than the baseline counts as a regression
+COMPARED_METRICS = ('export_cold', 'export_warm', 'mask_maps', 'def', 'export_peak_memory')
+
+def reset_scene():
+    for collection in (bpy.data.objects, bpy.data.meshes, bpy.data.materials, bpy.data.images, bpy.data.actions):
+        for datablock in list(collection):
+            collection.remove(datablock)
+
+def build_image(name, size, rng):
+    image = bpy.data.images.new(name, width=size, height=size, alpha=True)
+    # Smooth noise compresses like a real texture rather than like white noise
+    coarse = rng.random((8, 8, 4), dtype=np.float32)
+    pixels = np.kron(coarse, np.ones((size // 8, size // 8, 1), dtype=np.float32))
+    pixels += rng.random(pixels.shape, dtype=np.float32) * np.float32(0.05)
+    image.pixels.foreach_set(np.clip(pixels, 0.0, 1.0).ravel())
+    return image
+
+def build_material(index, params, rng):
+    material = bpy.data.materials.new(f"Bench Material {index}")
+    material.use_nodes = True
+    nodes = material.node_tree.nodes
+    links = material.node_tree.links
+    principled = next(node for node in nodes if node.type == 'BSDF_PRINCIPLED')
+
+    size = params['texture_size']
+    for input_name in ('Base Color', 'Metallic', 'Roughness', 'Normal'):
+        texture = nodes.new('ShaderNodeTexImage')
+        texture.image = build_image(f"bench_{index}_{input_name}", size, rng)
+        output = texture.outputs['Color']
+        if input_name == 'Base Color':
+            # A chain of nodes between the texture and the input exercises find_texture_node
+            for depth in range(params['node_depth']):
+                gamma = nodes.new('ShaderNodeGamma')
+                links.new(output, gamma.inputs['Color'])
+                output = gamma.outputs['Color']
+        elif input_name == 'Normal':
+            normal_map = nodes.new('ShaderNodeNormalMap')
+            links.new(output, normal_map.inputs['Color'])
+            output = normal_map.outputs['Normal']
+        links.new(output, principled.inputs[input_name])
+    return material
+
+def build_grid_mesh(name, grid, rng):
+    # A grid x grid quad plane with a little height noise and UVs
+    xs, ys = np.meshgrid(np.linspace(-1.0, 1.0, grid + 1), np.linspace(-1.0, 1.0, grid + 1))
+    zs = rng.random(xs.shape) * 0.05
+    vertices = np.stack((xs, ys, zs), axis=-1).reshape(-1, 3)
+    corners = np.arange((grid + 1) * (grid + 1)).reshape(grid + 1, grid + 1)[:-1, :-1].ravel()
+    faces = np.stack((corners, corners + 1, corners + grid + 2, corners + grid + 1), axis=-1)
+
+    mesh = bpy.data.meshes.new(name)
+    mesh.from_pydata(vertices.tolist(), [], faces.tolist())
+    uv_layer = mesh.uv_layers.new(name="UVMap")
+    loop_vertices = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get('vertex_index', loop_vertices)
+    uvs = (vertices[loop_vertices, :2] + 1.0) / 2.0
+    uv_layer.data.foreach_set('uv', uvs.astype(np.float32).ravel())
+    mesh.update()
+    return mesh
+
+def build_scene(name, params, seed=0):
+    reset_scene()
+    rng = np.random.default_rng(seed)
+    scene = bpy.context.scene
+    materials = [build_material(index, params, rng) for index in range(params['materials'])]
+    for index in range(params['objects']):
+        obj = bpy.data.objects.new(f"Bench Object {index}", build_grid_mesh(f"Bench Mesh {index}", params['grid'], rng))
+        obj.location = (index * 2.5, 0.0, 0.0)
+        obj.data.materials.append(materials[index % len(materials)])
+        scene.collection.objects.link(obj)
+    scene.model_name = f"bench_{name}"
+    return scene
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+def traced(function, *args):
+    # Wall time and peak traced memory of one call
+    tracemalloc.start()
+    try:
+        seconds = timed(function, *args)
+        return seconds, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run_export(scene, use_cache):
+    scene.use_export_cache = use_cache
+    result = bpy.ops.object.export_fbx_def()
+    if 'FINISHED' not in result:
+        raise RuntimeError(f"Export failed for {scene.model_name}: {result}")
+
+def run_mask_maps(scene, output_path):
+    index = exporter.build_material_index(scene)
+    for material in index:
+        exporter.generate_unity_mask_map(material, output_path, material_index=index)
+
+def run_def(scene):
+    index = exporter.build_material_index(scene)
+    with io.StringIO() as f:
+        for material, entry in index.items():
+            exporter.write_def_file(material, f, f"{material.name}_MaskMap", entry)
+
+def benchmark_scale(name, params, workdir, repeat, trace_memory=False):
+    scene = build_scene(name, params)
+    scene.use_modal_export = False
+    bpy.ops.wm.save_as_mainfile(filepath=os.path.join(workdir, f"bench_{name}.blend"))
+    mask_map_dir = os.path.join(workdir, f"mask_maps_{name}")
+    os.makedirs(mask_map_dir, exist_ok=True)
+
+    names = ['export_cold', 'export_warm', 'mask_maps', 'def']
+    if trace_memory:
+        names += ['export_peak_memory', 'mask_maps_peak_memory']
+    samples = {metric: [] for metric in names}
+    for run in range(repeat):
+        samples['export_cold'].append(timed(run_export, scene, False))
+        samples['export_warm'].append(timed(run_export, scene, True))
+        samples['mask_maps'].append(timed(run_mask_maps, scene, mask_map_dir))
+        samples['def'].append(timed(run_def, scene))
+        if trace_memory:
+            # Tracing slows the export down several times over, so memory gets runs of its own
+            scene.use_export_cache = False
+            summary = exporter.export_model(scene, trace_memory=True)
+            with open(summary['report'], 'r', encoding='utf-8') as f:
+                samples['export_peak_memory'].append(json.load(f)['peak_traced_memory'])
+            samples['mask_maps_peak_memory'].append(traced(run_mask_maps, scene, mask_map_dir)[1])
+
+    metrics = {metric: statistics.median(values) for metric, values in samples.items()}
+    # Whole-process peak so far, which also covers the scales that ran before this one
+    if exporter.process_peak_memory() is not None:
+        metrics['process_lifetime_peak_memory'] = exporter.process_peak_memory()
+    triangles = sum(len(obj.data.polygons) * 2 for obj in scene.objects if obj.type == 'MESH')
+    return {
+        'params': dict(params, triangles=triangles),
+        'metrics': metrics,
+    }
+
+def compare(results, baseline, tolerance):
+    # Returns (scale, metric, baseline, current, ratio) for every metric past the tolerance
+    regressions = []
+    for scale, result in sorted(results['scales'].items()):
+        previous = baseline.get('scales', {}).get(scale)
+        if not previous:
+            continue
+        for metric in COMPARED_METRICS:
+            old = previous['metrics'].get(metric)
+            new = result['metrics'].get(metric)
+            if not old or new is None:
+                continue
+            ratio = new / old
+            marker = "REGRESSION" if ratio > 1.0 + tolerance else ""
+            print(f"{scale:<14} {metric:<20} {old:>14.4f} -> {new:>14.4f}  x{ratio:5.2f} {marker}")
+            if marker:
+                regressions.append((scale, metric, old, new, ratio))
+    return regressions
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(prog="bakin_benchmark", description="Benchmark the Bakin exporter.")
+    parser.add_argument("--scales", default="small,medium", help=f"Comma separated, from: {', '.join(SCALES)}.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scale; the median is reported.")
+    parser.add_argument("--output", default="bench_results.json", help="Results file to write.")
+    parser.add_argument("--baseline", help="Previous results file to compare against.")
+    parser.add_argument("--trace-memory", action="store_true", help="Also measure peak traced memory in separate runs.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before failing (0.25 = 25%%).")
+    args = parser.parse_args(argv)
+
+    exporter.register()
+    results = {
+        'blender': bpy.app.version_string,
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'scales': {},
+    }
+    with tempfile.TemporaryDirectory(prefix="bakin_bench_") as workdir:
+        for name in args.scales.split(','):
+            name = name.strip()
+            print(f"Benchmarking scale '{name}'...")
+            results['scales'][name] = benchmark_scale(name, SCALES[name], workdir, args.repeat, args.trace_memory)
+            for metric, value in sorted(results['scales'][name]['metrics'].items()):
+                print(f"  {metric:<22} {value:.4f}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}.")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
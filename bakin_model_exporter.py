@@ -10,10 +10,27 @@ bl_info = {
     "category": "3D View",
 }
 
+import argparse
+import bmesh
 import bpy
+import contextlib
+import hashlib
+import json
 import os
 import unicodedata
 import re
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
 
 from bpy.types import Operator, Panel
 
@@ -26,6 +43,41 @@ TEXT = {
         'invert_metallic': "Invert Metallic",
         'invert_emissive': "Invert Emissive",
         'invert_specular': "Invert Specular",
+        'export_options': "Export Options",
+        'use_export_cache': "Skip Unchanged Files",
+        'texture_threads': "Texture Threads (0 = Auto)",
+        'texture_memory_limit': "Texture Memory (MB)",
+        'mask_map_tile_budget': "Mask Map Tile Budget (MB)",
+        'trace_export_memory': "Trace Memory per Phase (Slow)",
+        'use_modal_export': "Export in Background",
+        'cancel_button': "Cancel Export",
+        'phase_prepare': "Preparing...",
+        'phase_textures': "Saving textures...",
+        'phase_fbx': "Exporting FBX...",
+        'phase_mask_maps': "Packing mask maps...",
+        'phase_writing': "Writing files...",
+        'phase_def': "Writing .def...",
+        'last_export': "Last export:",
+        'check_button': "Check Scene",
+        'check_results': "Check results:",
+        'max_texture_size': "Max Texture Size",
+        'use_power_of_two_textures': "Power of Two Sizes",
+        'material_max_texture_size': "Max Texture Size ({})",
+        'merge_def_file': "Keep .def Edits",
+        'use_texture_atlas': "Texture Atlases",
+        'atlas_max_size': "Atlas Size",
+        'phase_atlases': "Packing atlases...",
+        'use_vertex_cache_optimization': "Optimize Vertex Cache",
+        'animation_options': "Animation Options",
+        'bake_anim': "Bake Animation",
+        'bake_anim_step': "Sampling Rate",
+        'bake_anim_simplify_factor': "Simplify",
+        'use_keyframe_reduction': "Reduce Keyframes",
+        'keyframe_tolerance': "Tolerance",
+        'use_lod': "LOD Chain",
+        'lod_ratios': "LOD Ratios",
+        'lod_min_triangles': "Minimum Triangles",
+        'phase_lods': "Exporting LODs...",
         'important_info': "Important Information:",
         'limitations': "Limitations:",
         'limitations_details': [
@@ -52,6 +104,41 @@ TEXT = {
         'invert_metallic': "メタリック反転",
         'invert_emissive': "エミッシブ反転",
         'invert_specular': "スペキュラ反転",
+        'export_options': "エクスポートオプション",
+        'use_export_cache': "変更のないファイルをスキップ",
+        'texture_threads': "テクスチャスレッド数 (0 = 自動)",
+        'texture_memory_limit': "テクスチャメモリ (MB)",
+        'mask_map_tile_budget': "マスクマップのタイル予算 (MB)",
+        'trace_export_memory': "フェーズごとのメモリを記録 (低速)",
+        'use_modal_export': "バックグラウンドでエクスポート",
+        'cancel_button': "エクスポートをキャンセル",
+        'phase_prepare': "準備中...",
+        'phase_textures': "テクスチャを保存中...",
+        'phase_fbx': "FBX をエクスポート中...",
+        'phase_mask_maps': "マスクマップを作成中...",
+        'phase_writing': "ファイルを書き込み中...",
+        'phase_def': ".def を書き込み中...",
+        'last_export': "前回のエクスポート:",
+        'check_button': "シーンをチェック",
+        'check_results': "チェック結果:",
+        'max_texture_size': "最大テクスチャサイズ",
+        'use_power_of_two_textures': "2のべき乗サイズ",
+        'material_max_texture_size': "最大テクスチャサイズ ({})",
+        'merge_def_file': ".defの編集を保持",
+        'use_texture_atlas': "テクスチャアトラス",
+        'atlas_max_size': "アトラスサイズ",
+        'phase_atlases': "アトラスを作成中...",
+        'use_vertex_cache_optimization': "頂点キャッシュ最適化",
+        'animation_options': "アニメーションオプション",
+        'bake_anim': "アニメーションをベイク",
+        'bake_anim_step': "サンプリングレート",
+        'bake_anim_simplify_factor': "簡略化",
+        'use_keyframe_reduction': "キーフレームを削減",
+        'keyframe_tolerance': "許容誤差",
+        'use_lod': "LODチェーン",
+        'lod_ratios': "LOD比率",
+        'lod_min_triangles': "最小ポリゴン数",
+        'phase_lods': "LODをエクスポート中...",
         'important_info': "重要な情報:",
         'limitations': "制限事項:",
         'limitations_details': [
@@ -78,6 +165,41 @@ TEXT = {
         'invert_metallic': "反转金属度",
         'invert_emissive': "反转自发光",
         'invert_specular': "反转高光",
+        'export_options': "导出选项",
+        'use_export_cache': "跳过未更改的文件",
+        'texture_threads': "纹理线程数 (0 = 自动)",
+        'texture_memory_limit': "纹理内存 (MB)",
+        'mask_map_tile_budget': "蒙版贴图分块预算 (MB)",
+        'trace_export_memory': "记录每个阶段的内存 (较慢)",
+        'use_modal_export': "后台导出",
+        'cancel_button': "取消导出",
+        'phase_prepare': "准备中...",
+        'phase_textures': "正在保存纹理...",
+        'phase_fbx': "正在导出 FBX...",
+        'phase_mask_maps': "正在打包蒙版贴图...",
+        'phase_writing': "正在写入文件...",
+        'phase_def': "正在写入 .def...",
+        'last_export': "上次导出:",
+        'check_button': "检查场景",
+        'check_results': "检查结果:",
+        'max_texture_size': "最大纹理尺寸",
+        'use_power_of_two_textures': "2 的幂尺寸",
+        'material_max_texture_size': "最大纹理尺寸 ({})",
+        'merge_def_file': "保留 .def 修改",
+        'use_texture_atlas': "纹理图集",
+        'atlas_max_size': "图集尺寸",
+        'phase_atlases': "正在打包图集...",
+        'use_vertex_cache_optimization': "优化顶点缓存",
+        'animation_options': "动画选项",
+        'bake_anim': "烘焙动画",
+        'bake_anim_step': "采样率",
+        'bake_anim_simplify_factor': "简化",
+        'use_keyframe_reduction': "减少关键帧",
+        'keyframe_tolerance': "容差",
+        'use_lod': "LOD 链",
+        'lod_ratios': "LOD 比例",
+        'lod_min_triangles': "最少三角面数",
+        'phase_lods': "正在导出 LOD...",
         'important_info': "重要信息:",
         'limitations': "限制:",
         'limitations_details': [
@@ -99,6 +221,61 @@ TEXT = {
     }
 }
 
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_COMPRESSION_LEVEL = 6
+PNG_IDAT_SIZE = 1 << 20
+
+# Rough working set per pixel when a mask map is packed in one go (four float sources and the
+# packed result) and per pixel of a band when it is streamed (float temporaries and 8-bit rows)
+MASK_MAP_BYTES_PER_PIXEL = 96
+MASK_MAP_TILE_BYTES_PER_PIXEL = 32
+
+FBX_EXPORT_SETTINGS = {
+    'use_selection': False,
+    'global_scale': 0.01,
+    'use_mesh_modifiers': False,
+    'use_triangles': True,
+    'add_leaf_bones': False,
+    'use_tspace': True,
+}
+
+# Texture atlases: Principled inputs they can hold, cell limits and the gutter around each cell
+ATLAS_INPUTS = ('Base Color', 'Normal')
+MASK_MAP_INPUTS = ('Metallic', 'Roughness', 'Emission Color', 'Specular Tint', 'IOR Level')
+ATLAS_MIN_CELL = 64
+ATLAS_PADDING = 4
+ATLAS_UV_EPSILON = 1e-4
+ATLAS_FLAT_NORMAL = (128, 128, 255, 255)
+
+# Keyframe properties saved before keyframe reduction and restored after the export
+KEYFRAME_VECTORS = ('co', 'handle_left', 'handle_right')
+KEYFRAME_SETTINGS = (
+    'interpolation', 'easing', 'handle_left_type', 'handle_right_type', 'type', 'back', 'amplitude', 'period',
+)
+
+# Post-transform cache entries assumed by the triangle reordering and the ACMR figures
+VERTEX_CACHE_SIZE = 16
+
+# Written next to the final output and moved into place only once the export has succeeded
+EXPORT_STAGING_DIR = ".bakin_export_staging"
+# Time slice for each step of the non-blocking export before control returns to the UI
+EXPORT_STEP_SECONDS = 0.05
+
+# Bump whenever the layout of exported files changes so older manifests are ignored
+MANIFEST_VERSION = 4
+
+# Value property, components and dtype for each mesh attribute type hashed by scene_digest
+ATTRIBUTE_VALUES = {
+    'FLOAT': ('value', 1, np.float32),
+    'INT': ('value', 1, np.int32),
+    'INT8': ('value', 1, np.int32),
+    'BOOLEAN': ('value', 1, np.bool_),
+    'FLOAT2': ('vector', 2, np.float32),
+    'FLOAT_VECTOR': ('vector', 3, np.float32),
+    'FLOAT_COLOR': ('color', 4, np.float32),
+    'BYTE_COLOR': ('color', 4, np.float32),
+}
+
 texture_dict = {
     'Base Color': "AMap",
     'Normal': "NMap",
@@ -110,49 +287,89 @@ texture_dict = {
     'outlineWeight': "outlineWeight"
 }
 
+# .def keys derived from the material; merging with an existing .def keeps every other key as it was
+DEF_GENERATED_KEYS = {'mtl', 'RMMap', 'LitColor'} | set(texture_dict.values())
+# Also derived from the material, but only updated when its line colour changed since the last export
+DEF_OUTLINE_KEYS = {'outlineWidth', 'outlineColor'}
+
 class ExportFBXOperator(Operator):
     bl_idname = "object.export_fbx_def"
     bl_label = "Export FBX + DEF"
     bl_options = {'REGISTER', 'UNDO'}
 
+    def invoke(self, context, event):
+        if not context.scene.use_modal_export:
+            return self.execute(context)
+        if self.export_running(context):
+            return {'CANCELLED'}
+
+        result = bpy.ops.wm.save_mainfile('INVOKE_DEFAULT')
+        if 'CANCELLED' in result:
+            return {'CANCELLED'}
+
+        wm = context.window_manager
+        self._steps = export_steps(context.scene, trace_memory=context.scene.trace_export_memory)
+        self._timer = wm.event_timer_add(EXPORT_STEP_SECONDS, window=context.window)
+        wm.bakin_export_running = True
+        wm.bakin_export_cancel = False
+        wm.bakin_export_progress = 0.0
+        wm.bakin_export_phase = 'phase_prepare'
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        wm = context.window_manager
+        if event.type == 'ESC' or wm.bakin_export_cancel:
+            self.cancel(context)
+            self.report({'WARNING'}, "Export cancelled, previous output left untouched.")
+            return {'CANCELLED'}
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        # Run steps for one time slice, then hand control back to the UI
+        deadline = time.perf_counter() + EXPORT_STEP_SECONDS
+        try:
+            while time.perf_counter() < deadline:
+                wm.bakin_export_phase, wm.bakin_export_progress = next(self._steps)
+        except StopIteration as done:
+            self.finish(context)
+            self.report_summary(done.value)
+            return {'FINISHED'}
+        except Exception as e:
+            self.finish(context)
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+
+        for area in context.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+        return {'PASS_THROUGH'}
+
+    def cancel(self, context):
+        # Closing the generator runs its cleanup, which removes the staging folder
+        self._steps.close()
+        self.finish(context)
+
+    def finish(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.bakin_export_running = False
+        wm.bakin_export_cancel = False
+        for area in context.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
     def execute(self, context):
+        if self.export_running(context):
+            return {'CANCELLED'}
         try:
-            result = bpy.ops.wm.save_mainfile('INVOKE_DEFAULT')
-            if 'CANCELLED' in result:
-                return {'CANCELLED'}
-            
-            model_name = context.scene.model_name
-            dirpath = bpy.path.abspath("//" + model_name)
-            os.makedirs(dirpath, exist_ok=True)
-            
-            for image in bpy.data.images:
-                if image.has_data and image.type == 'IMAGE':
-                    new_image_name = sanitize_filename(image.name.replace(' ', '_'))
-                    image.save_render(os.path.join(dirpath, new_image_name + ".png"))
-
-            filepath = os.path.join(dirpath, model_name + ".fbx")
-            bpy.ops.export_scene.fbx(
-                filepath=filepath,
-                use_selection=False,
-                global_scale=0.01,
-                use_mesh_modifiers=False,
-                use_triangles=True,
-                add_leaf_bones=False,
-                use_tspace=True
-            )
+            # Background Blender (scripts, benchmarks) has nobody to answer a save dialog
+            if not bpy.app.background:
+                result = bpy.ops.wm.save_mainfile('INVOKE_DEFAULT')
+                if 'CANCELLED' in result:
+                    return {'CANCELLED'}
 
-            def_filepath = os.path.join(dirpath, model_name + ".def")
-            with open(def_filepath, 'w') as f:
-                for obj in bpy.context.scene.objects:
-                    if obj.type == 'MESH' and obj.data.materials:
-                        for material in obj.data.materials:
-                            if material:
-                                material.name = sanitize_material_name(material.name)
-                                mask_map_path = generate_unity_mask_map(material, dirpath)
-                                if mask_map_path:
-                                    filename = sanitize_filename(os.path.basename(mask_map_path))
-                                    print(f"Generated mask map: {filename}")
-                                    write_def_file(material, f, filename)
+            self.report_summary(export_model(context.scene, trace_memory=context.scene.trace_export_memory))
 
         except Exception as e:
             self.report({'ERROR'}, str(e))
@@ -160,142 +377,1941 @@ class ExportFBXOperator(Operator):
 
         return {'FINISHED'}
 
-def find_texture_node(node):
+    def export_running(self, context):
+        # The panel hides the button during an export, but F3 search or a shortcut can still run it
+        if context.window_manager.bakin_export_running:
+            self.report({'WARNING'}, "An export is already running; wait for it to finish or cancel it.")
+            return True
+        return False
+
+    def report_summary(self, summary):
+        bpy.context.window_manager.bakin_export_summary = "\n".join(summary['report_summary'])
+        print(f"Export report: {summary['report']}")
+        if summary['skipped_images']:
+            self.report({'INFO'}, f"Exported {summary['images']} images, skipped {len(summary['skipped_images'])} not used by the model (see console).")
+
+class CancelExportOperator(Operator):
+    bl_idname = "object.cancel_export_fbx_def"
+    bl_label = "Cancel Export"
+
+    def execute(self, context):
+        # The running export notices this on its next timer tick
+        context.window_manager.bakin_export_cancel = True
+        return {'FINISHED'}
+
+def export_model(scene, dirpath=None, trace_memory=False):
+    # The whole export pipeline in one go, shared by the sidebar button and the command line
+    steps = export_steps(scene, dirpath, trace_memory)
+    while True:
+        try:
+            next(steps)
+        except StopIteration as done:
+            return done.value
+
+def export_steps(scene, dirpath=None, trace_memory=False):
+    # Generator running the export one small step at a time; yields (phase, progress) in between
+    # and returns the summary. Everything is written to a staging folder that only replaces the
+    # previous output at the very end, so closing the generator early leaves no partial export.
+    # Problems that would break the export are caught here, before anything is read or written
+    analysis = analyze_scene(scene, dirpath)
+    for line in analysis_lines(analysis):
+        print(line)
+    if analysis['errors']:
+        more = f" (and {len(analysis['errors']) - 1} more, see Check Scene)" if len(analysis['errors']) > 1 else ""
+        raise ValueError(f"Export stopped before writing anything: {analysis['errors'][0]}{more}")
+
+    model_name = scene.model_name
+    if dirpath is None:
+        dirpath = bpy.path.abspath("//" + model_name)
+    os.makedirs(dirpath, exist_ok=True)
+    # A folder of its own per run, so another export to the same folder cannot clear it
+    staging = tempfile.mkdtemp(prefix=EXPORT_STAGING_DIR + "_", dir=dirpath)
+
+    report = ExportReport(trace_memory)
+    writer = None
+    atlas_materials = []
+    temporary_images = []
+    try:
+        yield 'phase_prepare', 0.0
+        with report.measure('prepare'):
+            export_cache = ExportCache(dirpath, model_name, enabled=scene.use_export_cache)
+
+            # Rename before anything is written so the FBX and the .def agree on material names
+            for material in scene_materials(scene):
+                material.name = sanitize_material_name(material.name)
+            material_index = build_material_index(scene)
+
+            # Atlased materials are replaced by one stand-in material per atlas in the FBX and .def
+            atlases = []
+            if scene.use_texture_atlas:
+                atlases = plan_texture_atlases(scene, material_index, scene.atlas_max_size)
+            for atlas in atlases:
+                atlas_material, placeholder_images = create_atlas_material(atlas)
+                atlas_materials.append(atlas_material)
+                temporary_images.extend(placeholder_images)
+            atlased = {material for atlas in atlases for material, x, y, size in atlas['cells']}
+            exported_index = {material: entry for material, entry in material_index.items() if material not in atlased}
+            atlas_images = {image.name for material in atlased for image in material_index[material]['images']}
+
+            images, skipped_images = image_export_plan(scene, exported_index)
+            skipped_images = [
+                (image, "packed into a texture atlas" if image.name in atlas_images else reason)
+                for image, reason in skipped_images
+            ]
+            for image, reason in skipped_images:
+                print(f"Skipped image '{image.name}': {reason}")
+
+            texture_files, texture_filenames, duplicate_images = plan_texture_files(images, export_cache)
+            for image, original in duplicate_images:
+                print(f"Image '{image.name}' is identical to '{original.name}', exported once as {texture_filenames[image.name]}")
+
+            # The file written for a set of duplicates has to satisfy every material using any of them
+            texture_limits = texture_size_limits(scene, exported_index)
+            for image, original in duplicate_images:
+                texture_limits[original.name] = merge_texture_limits(
+                    texture_limits.get(original.name, scene.max_texture_size), texture_limits.get(image.name, scene.max_texture_size))
+
+            lod_ratios = parse_lod_ratios(scene.lod_ratios) if scene.use_lod else []
+            lod_triangles = [scene_triangle_count(scene)] if lod_ratios else []
+
+        total = len(texture_files) + len(exported_index) + len(atlases) + len(lod_ratios) + 3
+        done = 0
+
+        writer = TextureWriter(
+            max_workers=scene.texture_threads,
+            memory_limit=scene.texture_memory_limit * 1024 * 1024,
+            report=report,
+        )
+        for image, image_filename, digest in texture_files:
+            yield 'phase_textures', done / total
+            with report.measure('texture_read', image.name):
+                # The export size follows from the pixels and the budget, so the cache is checked
+                # before reading image.size, which would decode the image
+                limit = texture_limits.get(image.name, scene.max_texture_size)
+                if limit or scene.use_power_of_two_textures:
+                    digest = f"{digest}:{limit}:{scene.use_power_of_two_textures}"
+                entry = export_cache.lookup('images', image_filename, digest)
+                if entry is None:
+                    source_size = list(image.size)
+                    size = list(texture_target_size(*source_size, limit, scene.use_power_of_two_textures))
+                    save_texture(image, os.path.join(staging, image_filename), writer, size)
+                    entry = {'source_size': source_size, 'size': size}
+                if entry['size'] != entry['source_size']:
+                    print(f"Texture '{image.name}' exported at {entry['size'][0]}x{entry['size'][1]} instead of {entry['source_size'][0]}x{entry['source_size'][1]}")
+                export_cache.record('images', image_filename, digest, files=[image_filename],
+                                    source_size=entry['source_size'], size=entry['size'])
+            done += 1
+
+        # Runs on the main thread while the workers are still encoding textures
+        yield 'phase_fbx', done / total
+        with report.measure('fbx', model_name) as measured:
+            fbx_filename = model_name + ".fbx"
+            fbx_settings = fbx_export_settings(scene)
+            fbx_key = dict(fbx_settings)
+            if scene.use_keyframe_reduction:
+                fbx_key['keyframe_tolerance'] = scene.keyframe_tolerance
+            if atlases:
+                fbx_key['atlases'] = atlas_signature(atlases)
+            if scene.use_vertex_cache_optimization:
+                fbx_key['vertex_cache'] = VERTEX_CACHE_SIZE
+            fbx_digest = scene_digest(scene, fbx_key)
+            previous_fbx_bytes = export_cache.previous.get('fbx', {}).get(fbx_filename, {}).get('bytes')
+            cached = export_cache.lookup('fbx', fbx_filename, fbx_digest)
+            if cached is None:
+                cached = {'vertex_cache': {}, 'keyframes': {}}
+                with atlas_mesh_copies(scene, atlases, atlas_materials):
+                    with reduced_actions(scene.use_keyframe_reduction, scene.keyframe_tolerance, cached['keyframes']):
+                        with vertex_cache_mesh_copies(scene, scene.use_vertex_cache_optimization, cached['vertex_cache']):
+                            bpy.ops.export_scene.fbx(filepath=os.path.join(staging, fbx_filename), **fbx_settings)
+                cached['bytes'] = measured['bytes'] = os.path.getsize(os.path.join(staging, fbx_filename))
+            vertex_cache = cached.get('vertex_cache', {})
+            keyframes = cached.get('keyframes', {})
+            fbx_bytes = cached.get('bytes')
+            export_cache.record('fbx', fbx_filename, fbx_digest, files=[fbx_filename],
+                                vertex_cache=vertex_cache, keyframes=keyframes, bytes=fbx_bytes)
+        done += 1
+
+        # Each LOD is a separate FBX from decimated copies of the meshes exported above
+        for level, ratio in enumerate(lod_ratios, 1):
+            yield 'phase_lods', done / total
+            with report.measure('lod', f"LOD{level}") as measured:
+                lod_filename = f"{model_name}_LOD{level}.fbx"
+                lod_digest = scene_digest(scene, dict(fbx_key, lod_ratio=ratio, lod_min_triangles=scene.lod_min_triangles))
+                cached = export_cache.lookup('fbx', lod_filename, lod_digest)
+                if cached is None:
+                    with atlas_mesh_copies(scene, atlases, atlas_materials):
+                        with lod_mesh_copies(scene, ratio, scene.lod_min_triangles):
+                            cached = {'triangles': scene_triangle_count(scene)}
+                            with reduced_actions(scene.use_keyframe_reduction, scene.keyframe_tolerance):
+                                with vertex_cache_mesh_copies(scene, scene.use_vertex_cache_optimization):
+                                    bpy.ops.export_scene.fbx(filepath=os.path.join(staging, lod_filename), **fbx_settings)
+                    measured['bytes'] = os.path.getsize(os.path.join(staging, lod_filename))
+                export_cache.record('fbx', lod_filename, lod_digest, files=[lod_filename], triangles=cached['triangles'])
+                lod_triangles.append(cached['triangles'])
+                print(f"LOD{level}: {cached['triangles']} triangles ({cached['triangles'] / max(lod_triangles[0], 1):.0%} of LOD0)")
+            done += 1
+
+        mask_map_cache = {}
+        records = []
+        for material, entry in exported_index.items():
+            yield 'phase_mask_maps', done / total
+            with report.measure('mask_map_read', material.name):
+                mask_map_path = generate_unity_mask_map(material, staging, mask_map_cache, export_cache, writer, material_index)
+            if mask_map_path:
+                filename = sanitize_filename(os.path.basename(mask_map_path))
+                print(f"Generated mask map: {filename}")
+                digest = material_digest(material, filename, texture_filenames)
+                cached = export_cache.lookup('materials', material.name, digest)
+                if cached is None:
+                    cached = {'record': material_def_record(material, filename, entry, texture_filenames)}
+                export_cache.record('materials', material.name, digest, record=cached['record'])
+                records.append(cached['record'])
+            done += 1
+
+        for atlas, atlas_material in zip(atlases, atlas_materials):
+            yield 'phase_atlases', done / total
+            with report.measure('atlas', atlas['name']):
+                sources = [
+                    export_cache.image_digest(image)
+                    for material, x, y, size in atlas['cells'] for image in material_index[material]['images']
+                ]
+                invert_flags = (scene.invert_emissive, scene.invert_roughness, scene.invert_metallic, scene.invert_specular)
+                digest = hashlib.sha1(repr((atlas_signature([atlas]), sources, invert_flags)).encode()).hexdigest()
+                atlas_files = [f"{atlas['name']}_{suffix}.png" for suffix in ('Base', 'Normal', 'MaskMap')]
+                if export_cache.lookup('atlases', atlas['name'], digest) is None:
+                    for suffix, pixels in build_atlas_images(atlas, material_index, scene).items():
+                        atlas_filepath = os.path.join(staging, f"{atlas['name']}_{suffix}.png")
+                        writer.submit(pixels.nbytes, write_png, atlas_filepath, pixels, phase='atlas_write', output=atlas_filepath)
+                export_cache.record('atlases', atlas['name'], digest, files=atlas_files)
+
+                records.append(material_def_record(atlas_material, f"{atlas['name']}_MaskMap", index_material(atlas_material)))
+                print(f"Packed {len(atlas['cells'])} materials into {atlas['name']} ({atlas['width']}x{atlas['height']})")
+            done += 1
+
+        while True:
+            with report.measure('wait_for_writes'):
+                finished = writer.wait(EXPORT_STEP_SECONDS)
+            if finished:
+                break
+            yield 'phase_writing', done / total
+        writer.finish()
+        done += 1
+
+        yield 'phase_def', done / total
+        with report.measure('def', model_name) as measured:
+            # Settings tuned by hand in the previous .def survive the re-export in merge mode
+            existing_records = read_def_file(os.path.join(dirpath, model_name + ".def")) if scene.merge_def_file else {}
+            last_records = {
+                entry['record'][0][1]: entry['record']
+                for entry in export_cache.last_export.get('materials', {}).values() if entry.get('record')
+            }
+            text = "".join(
+                render_def_record(merge_def_record(record, existing_records.get(record[0][1]), last_records.get(record[0][1])))
+                for record in records
+            )
+            # Every LOD uses the same materials, so each gets a copy of the same blocks
+            for def_name in [model_name] + [f"{model_name}_LOD{level}" for level in range(1, len(lod_ratios) + 1)]:
+                def_filepath = os.path.join(staging, def_name + ".def")
+                with open(def_filepath, 'w') as f:
+                    f.write(text)
+                measured['bytes'] += os.path.getsize(def_filepath)
+            export_cache.save(os.path.join(staging, os.path.basename(export_cache.filepath)))
+
+        with report.measure('commit'):
+            # Nothing outside the staging folder has been touched until here; the manifest goes last
+            manifest_filename = os.path.basename(export_cache.filepath)
+            for filename in sorted(os.listdir(staging), key=lambda name: name == manifest_filename):
+                os.replace(os.path.join(staging, filename), os.path.join(dirpath, filename))
+            # Mask maps are named by content, so an edited one leaves its old file behind
+            for filename in export_cache.stale_files('mask_maps'):
+                with contextlib.suppress(OSError):
+                    os.remove(os.path.join(dirpath, filename))
+    finally:
+        if writer is not None:
+            writer.close()
+        for atlas_material in atlas_materials:
+            bpy.data.materials.remove(atlas_material)
+        for image in temporary_images:
+            bpy.data.images.remove(image)
+        shutil.rmtree(staging, ignore_errors=True)
+        report.close()
+
+    report_filepath = os.path.join(dirpath, model_name + ".export_report.json")
+    acmr = None
+    if vertex_cache.get('triangles'):
+        acmr = [vertex_cache['misses_before'] / vertex_cache['triangles'], vertex_cache['misses_after'] / vertex_cache['triangles']]
+    report.save(report_filepath, model_name=model_name, images=len(texture_files),
+                duplicate_images=len(duplicate_images), materials=len(material_index), lod_triangles=lod_triangles,
+                acmr=acmr, keyframes=keyframes, fbx_bytes=fbx_bytes, previous_fbx_bytes=previous_fbx_bytes,
+                warnings=analysis['warnings'])
+
+    report_summary = report.summary_lines()
+    if lod_triangles:
+        report_summary.append("Triangles per LOD: " + ", ".join(str(count) for count in lod_triangles))
+    if acmr:
+        report_summary.append(f"Vertex cache ACMR: {acmr[0]:.3f} -> {acmr[1]:.3f}")
+    if keyframes.get('before'):
+        report_summary.append(f"Keyframes: {keyframes['before']} -> {keyframes['after']}")
+    if fbx_bytes is not None and previous_fbx_bytes is not None and previous_fbx_bytes != fbx_bytes:
+        report_summary.append(f"FBX size: {format_bytes(previous_fbx_bytes)} -> {format_bytes(fbx_bytes)}")
+
+    return {
+        'dirpath': dirpath,
+        'images': len(texture_files),
+        'duplicate_images': len(duplicate_images),
+        'skipped_images': [(image.name, reason) for image, reason in skipped_images],
+        'materials': len(material_index),
+        'atlases': len(atlases),
+        'lod_triangles': lod_triangles,
+        'acmr': acmr,
+        'keyframes': keyframes,
+        'fbx_bytes': fbx_bytes,
+        'warnings': analysis['warnings'],
+        'report': report_filepath,
+        'report_summary': report_summary,
+    }
+
+def analyze_scene(scene, dirpath=None):
+    # Read-only pre-flight check. errors stop the export, warnings are worth a look but the export
+    # works around them; the cost figures say roughly how much work the export will be.
+    start = time.perf_counter()
+    errors = []
+    warnings = []
+
+    if not scene.model_name.strip():
+        errors.append("The model name is empty.")
+    if dirpath is None and not bpy.data.filepath:
+        errors.append("The .blend file has never been saved, so there is no folder to export to.")
+    if not any(obj.type == 'MESH' for obj in scene.objects):
+        errors.append("The scene has no mesh objects to export.")
+    if scene.use_lod:
+        try:
+            parse_lod_ratios(scene.lod_ratios)
+        except ValueError as e:
+            errors.append(f"LOD Ratios: {e}.")
+
+    # Materials are renamed to their sanitised names on export; two landing on the same name
+    # would leave the FBX and the .def disagreeing about which is which
+    material_index = build_material_index(scene)
+    by_name = {}
+    for material in material_index:
+        by_name.setdefault(sanitize_material_name(material.name), []).append(material.name)
+    for sanitized, names in by_name.items():
+        if len(names) > 1:
+            errors.append(f"Materials {', '.join(repr(name) for name in names)} would all be exported as '{sanitized}'; rename them.")
+
+    for material, entry in material_index.items():
+        if not material.use_nodes:
+            warnings.append(f"Material '{material.name}' does not use nodes; it gets no mask map or .def block.")
+            continue
+        if entry['principled'] is None:
+            warnings.append(f"Material '{material.name}' has no Principled BSDF; it gets no mask map or .def block.")
+            continue
+        for input in entry['principled'].inputs:
+            if not input.is_linked:
+                continue
+            images = []
+            for link in input.links:
+                for node in find_texture_nodes(link.from_node, []):
+                    if node.image and node.image not in images:
+                        images.append(node.image)
+            if len(images) > 1:
+                warnings.append(f"Material '{material.name}': {len(images)} textures are chained into '{input.name}'; only '{images[0].name}' is referenced in the .def.")
+
+    images, skipped_images = image_export_plan(scene, material_index)
+    for image, reason in skipped_images:
+        if reason in ("source file is missing", "no pixel data"):
+            warnings.append(f"Image '{image.name}' is used by the model but will not be exported: {reason}.")
+
+    texture_pixels = 0
+    unknown_sizes = 0
+    for image in images:
+        size = image_size_without_loading(image)
+        if size is None:
+            unknown_sizes += 1
+        else:
+            texture_pixels += size[0] * size[1]
+
+    return {
+        'errors': errors,
+        'warnings': warnings,
+        'materials': len(material_index),
+        'mask_maps': sum(1 for entry in material_index.values() if entry['principled'] is not None),
+        'textures': len(images),
+        'texture_pixels': texture_pixels,
+        'unknown_texture_sizes': unknown_sizes,
+        'triangles': scene_triangle_count(scene),
+        'seconds': time.perf_counter() - start,
+    }
+
+def image_size_without_loading(image):
+    # Size of an image without decoding it: loaded images know theirs, PNG files have it in the header
+    if image.has_data:
+        return tuple(image.size)
+    filepath = bpy.path.abspath(image.filepath, library=image.library) if image.source == 'FILE' and not image.packed_file else ""
+    try:
+        with open(filepath, 'rb') as f:
+            header = f.read(24)
+    except OSError:
+        return None
+    if len(header) == 24 and header.startswith(PNG_SIGNATURE) and header[12:16] == b'IHDR':
+        return struct.unpack('>II', header[16:24])
+    return None
+
+def analysis_lines(analysis):
+    lines = [f"Error: {error}" for error in analysis['errors']]
+    lines += [f"Warning: {warning}" for warning in analysis['warnings']]
+    if not lines:
+        lines.append("No problems found.")
+    unknown = f" + {analysis['unknown_texture_sizes']} of unknown size" if analysis['unknown_texture_sizes'] else ""
+    lines.append(
+        f"Cost: {analysis['materials']} materials, {analysis['mask_maps']} mask maps, {analysis['textures']} textures "
+        f"({analysis['texture_pixels'] / 1e6:.1f} Mpx{unknown}), {analysis['triangles']} triangles"
+    )
+    return lines
+
+class ExportReport:
+    # Wall time and bytes written per export phase plus the process's peak memory, saved as JSON next
+    # to the .def. Worker-thread writes are recorded with their own timings.
+    # The process peak covers the whole Blender session, so its value at the start of the export is
+    # kept too: the difference is how far this export pushed it up.
+    # tracemalloc slows pure-Python code (FBX export, Tipsify, keyframe reduction) by an order of
+    # magnitude, so peak traced memory per phase is only recorded with trace_memory; worker memory
+    # then shows up in the main-thread phases running at the same time.
+
+    def __init__(self, trace_memory=False):
+        self.entries = []
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.trace_memory = trace_memory
+        self.owns_tracemalloc = trace_memory and not tracemalloc.is_tracing()
+        if self.owns_tracemalloc:
+            tracemalloc.start()
+        self.peak_memory = 0
+        self.process_peak_at_start = process_peak_memory()
+
+    def close(self):
+        self.total_seconds = time.perf_counter() - self.started
+        if self.owns_tracemalloc and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.owns_tracemalloc = False
+
+    @contextlib.contextmanager
+    def measure(self, phase, item=None):
+        entry = {'phase': phase, 'item': item, 'bytes': 0}
+        if self.trace_memory and hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry['seconds'] = time.perf_counter() - start
+            entry['peak_memory'] = tracemalloc.get_traced_memory()[1] if self.trace_memory and tracemalloc.is_tracing() else None
+            self.peak_memory = max(self.peak_memory, entry['peak_memory'] or 0)
+            self.add(entry)
+
+    def add(self, entry):
+        with self.lock:
+            self.entries.append(entry)
+
+    def phases(self):
+        # Totals per phase in the order the phases first ran
+        totals = {}
+        for entry in self.entries:
+            total = totals.setdefault(entry['phase'], {'count': 0, 'seconds': 0.0, 'bytes': 0, 'peak_memory': 0})
+            total['count'] += 1
+            total['seconds'] += entry['seconds']
+            total['bytes'] += entry['bytes']
+            total['peak_memory'] = max(total['peak_memory'], entry['peak_memory'] or 0)
+        return totals
+
+    def to_dict(self, **extra):
+        process_peak = process_peak_memory()
+        raised = None
+        if process_peak is not None and self.process_peak_at_start is not None:
+            raised = max(0, process_peak - self.process_peak_at_start)
+        return dict(
+            extra,
+            total_seconds=getattr(self, 'total_seconds', time.perf_counter() - self.started),
+            bytes_written=sum(entry['bytes'] for entry in self.entries),
+            peak_traced_memory=self.peak_memory if self.trace_memory else None,
+            process_lifetime_peak_memory=process_peak,
+            process_lifetime_peak_at_start=self.process_peak_at_start,
+            process_peak_raised_by_export=raised,
+            phases=self.phases(),
+            entries=self.entries,
+        )
+
+    def save(self, filepath, **extra):
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(**extra), f, indent=1)
+
+    def summary_lines(self):
+        report = self.to_dict()
+        line = f"{report['total_seconds']:.2f} s, {format_bytes(report['bytes_written'])} written"
+        if self.trace_memory:
+            line += f", traced peak {format_bytes(report['peak_traced_memory'])}"
+        lines = [line]
+        if report['process_lifetime_peak_memory'] is not None:
+            lines.append(f"Blender peak since start: {format_bytes(report['process_lifetime_peak_memory'])}"
+                         + (f" (+{format_bytes(report['process_peak_raised_by_export'])} in this export)"
+                            if report['process_peak_raised_by_export'] is not None else ""))
+        for phase, total in sorted(report['phases'].items(), key=lambda item: -item[1]['seconds']):
+            traced = f", peak {format_bytes(total['peak_memory'])}" if self.trace_memory else ""
+            lines.append(f"{phase}: {total['seconds']:.2f} s ({total['count']}x, {format_bytes(total['bytes'])}{traced})")
+        return lines
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+def process_peak_memory():
+    # Peak resident memory of the whole Blender process, where the platform can tell us
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t),
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess
+        process.restype = wintypes.HANDLE
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process(), ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+        return None
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+INVERTIBLE_TEXTURES = ('roughness', 'metallic', 'emissive', 'specular')
+
+def export_cli(argv=None):
+    # blender -b model.blend --python bakin_model_exporter.py -- --model-name Hero --output-dir /tmp/Hero
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+
+    parser = argparse.ArgumentParser(
+        prog="bakin_model_exporter",
+        description="Export the open .blend file to FBX + DEF for RPG Developer BAKIN without the UI.",
+    )
+    parser.add_argument("--model-name", help="Model name (defaults to the one saved in the scene).")
+    parser.add_argument("--output-dir", help="Output folder (defaults to //<model name> next to the .blend).")
+    # Inversions saved in the scene are kept unless --invert-* or --no-invert-* is given
+    for texture in INVERTIBLE_TEXTURES:
+        parser.add_argument(f"--invert-{texture}", dest=f"invert_{texture}", action="store_true", default=None)
+        parser.add_argument(f"--no-invert-{texture}", dest=f"invert_{texture}", action="store_false", default=None)
+    parser.add_argument("--no-cache", action="store_true", help="Rewrite every file, even unchanged ones.")
+    parser.add_argument("--threads", type=int, help="Texture encoding threads (0 = one per CPU core).")
+    parser.add_argument("--max-texture-size", type=int, help="Scale textures and mask maps down to at most this many pixels.")
+    parser.add_argument("--power-of-two", action="store_true", help="Snap exported texture sizes to powers of two.")
+    parser.add_argument("--keyframe-tolerance", type=float, help="Reduce animation keyframes within this tolerance before export.")
+    parser.add_argument("--lod-ratios", help="Also export decimated LODs keeping these shares of triangles, e.g. 0.5,0.25.")
+    parser.add_argument("--trace-memory", action="store_true", help="Record peak traced memory per phase in the export report (slower).")
+    parser.add_argument("--check-only", action="store_true", help="Only run the pre-flight check; exit with 1 if it finds errors.")
+    parser.add_argument("--status-file", help="Write a JSON status (result, timing, error) to this path.")
+    args = parser.parse_args(argv)
+
+    scene = bpy.context.scene
+    if args.model_name:
+        scene.model_name = args.model_name
+    for texture in INVERTIBLE_TEXTURES:
+        if getattr(args, f"invert_{texture}") is not None:
+            setattr(scene, f"invert_{texture}", getattr(args, f"invert_{texture}"))
+    if args.no_cache:
+        scene.use_export_cache = False
+    if args.trace_memory:
+        scene.trace_export_memory = True
+    if args.threads is not None:
+        scene.texture_threads = args.threads
+    if args.max_texture_size is not None:
+        scene.max_texture_size = args.max_texture_size
+    if args.power_of_two:
+        scene.use_power_of_two_textures = True
+    if args.keyframe_tolerance is not None:
+        scene.use_keyframe_reduction = True
+        scene.keyframe_tolerance = args.keyframe_tolerance
+    if args.lod_ratios:
+        scene.use_lod = True
+        scene.lod_ratios = args.lod_ratios
+
+    status = {'blend_file': bpy.data.filepath, 'model_name': scene.model_name}
+    start = time.perf_counter()
+    try:
+        dirpath = os.path.abspath(args.output_dir) if args.output_dir else None
+        if args.check_only:
+            analysis = analyze_scene(scene, dirpath)
+            for line in analysis_lines(analysis):
+                print(line)
+            status.update(result='FAILED' if analysis['errors'] else 'FINISHED', analysis=analysis)
+            if analysis['errors']:
+                status['error'] = analysis['errors'][0]
+        else:
+            summary = export_model(scene, dirpath, scene.trace_export_memory)
+            status.update(result='FINISHED', **summary)
+    except Exception as e:
+        status.update(result='FAILED', error=f"{type(e).__name__}: {e}")
+        print(f"Export failed: {status['error']}")
+    status['seconds'] = time.perf_counter() - start
+
+    if args.status_file:
+        with open(args.status_file, 'w', encoding='utf-8') as f:
+            json.dump(status, f, indent=1)
+    return 0 if status['result'] == 'FINISHED' else 1
+
+def find_texture_node(node, memo=None):
+    # memo maps node pointers to their result so subgraphs shared by several inputs are walked once
+    if memo is not None and node.as_pointer() in memo:
+        return memo[node.as_pointer()]
+    tex_node = None
     if node and node.type == 'TEX_IMAGE':
-        return node
+        tex_node = node
+    else:
+        for input in node.inputs:
+            if input.is_linked:
+                for link in input.links:
+                    tex_node = find_texture_node(link.from_node, memo)
+                    if tex_node:
+                        break
+            if tex_node:
+                break
+    if memo is not None:
+        memo[node.as_pointer()] = tex_node
+    return tex_node
+
+def index_material(material, memo=None):
+    # principled: the first Principled BSDF, which the mask map reads from
+    # linked: input name -> image of a texture node linked straight into that principled node
+    # textures: (input name, image) for every input of every principled node, resolved upstream
+    # images: every image the export needs: those reachable from the material output, plus any
+    # texture the .def references from a principled node that is not connected to it
+    entry = {'principled': None, 'linked': {}, 'textures': [], 'images': []}
+    if not material.use_nodes:
+        return entry
+    if memo is None:
+        memo = {}
+    entry['images'] = node_tree_images(material.node_tree)
+
+    for node in material.node_tree.nodes:
+        if node.type != 'BSDF_PRINCIPLED':
+            continue
+        first = entry['principled'] is None
+        if first:
+            entry['principled'] = node
+        for input in node.inputs:
+            if not input.is_linked:
+                continue
+            link = input.links[0]
+            if first and link.from_node and link.from_node.type == 'TEX_IMAGE':
+                entry['linked'].setdefault(input.name, link.from_node.image)
+            for link in input.links:
+                texture_node = find_texture_node(link.from_node, memo)
+                if texture_node and hasattr(texture_node, 'image') and texture_node.image:
+                    entry['textures'].append((input.name, texture_node.image))
+    for input_name, image in entry['textures']:
+        if image not in entry['images']:
+            entry['images'].append(image)
+    return entry
+
+def build_material_index(scene):
+    # Built once per export; node groups and materials shared between objects are only walked once
+    memo = {}
+    return {material: index_material(material, memo) for material in scene_materials(scene)}
+
+def find_texture_nodes(node, found, visited=None):
+    # Like find_texture_node, but collects every image node upstream instead of the first one
+    if visited is None:
+        visited = set()
+    if node.as_pointer() in visited:
+        return found
+    visited.add(node.as_pointer())
+
+    if node.type == 'TEX_IMAGE':
+        found.append(node)
+    elif node.type == 'GROUP' and node.node_tree:
+        for group_node in node.node_tree.nodes:
+            if group_node.type == 'GROUP_OUTPUT':
+                find_texture_nodes(group_node, found, visited)
     for input in node.inputs:
         if input.is_linked:
             for link in input.links:
-                tex_node = find_texture_node(link.from_node)
-                if tex_node:
-                    return tex_node
-    return None
+                find_texture_nodes(link.from_node, found, visited)
+    return found
+
+def node_tree_images(node_tree):
+    found = []
+    visited = set()
+    for node in node_tree.nodes:
+        if node.type in ('OUTPUT_MATERIAL', 'OUTPUT_WORLD'):
+            find_texture_nodes(node, found, visited)
+    return [node.image for node in found if node.image]
+
+def scene_materials(scene):
+    # Unique materials of the scene's meshes, in the order the .def lists them
+    materials = []
+    for obj in scene.objects:
+        if obj.type == 'MESH' and obj.data.materials:
+            for material in obj.data.materials:
+                if material and material not in materials:
+                    materials.append(material)
+    return materials
+
+def image_export_plan(scene, material_index=None):
+    # Images the exported materials reference, and why every other image is left out
+    if material_index is None:
+        material_index = build_material_index(scene)
+    referenced = set()
+    for entry in material_index.values():
+        referenced.update(image.name for image in entry['images'])
+
+    world_images = set()
+    for world in bpy.data.worlds:
+        if world.use_nodes:
+            world_images.update(image.name for image in node_tree_images(world.node_tree))
+    texture_images = {texture.image.name for texture in bpy.data.textures if getattr(texture, 'image', None)}
+
+    images = []
+    skipped = []
+    for image in bpy.data.images:
+        if image.type != 'IMAGE':
+            skipped.append((image, "render result or viewer image"))
+        elif image.name not in referenced:
+            if image.users == 0:
+                skipped.append((image, "orphan image with no users"))
+            elif image.name in world_images:
+                skipped.append((image, "only used by the world (lighting)"))
+            elif image.name in texture_images:
+                skipped.append((image, "only used by a brush or texture datablock"))
+            else:
+                skipped.append((image, "not used by any exported material"))
+        elif image.source == 'FILE' and not image.packed_file and not os.path.isfile(bpy.path.abspath(image.filepath, library=image.library)):
+            skipped.append((image, "source file is missing"))
+        elif image.source not in ('FILE', 'GENERATED') and not image.has_data:
+            skipped.append((image, "no pixel data"))
+        else:
+            images.append(image)
+    return images, skipped
+
+def texture_filename(image, texture_filenames=None):
+    # The exported file for an image: the canonical one after deduplication, else its own name
+    if texture_filenames and image.name in texture_filenames:
+        return texture_filenames[image.name]
+    return sanitize_filename(image.name.replace(' ', '_')) + ".png"
+
+def plan_texture_files(images, export_cache):
+    # One file per unique texture content; duplicates point at the file of the first image with it
+    unique = []
+    filenames = {}
+    by_digest = {}
+    duplicates = []
+    for image in images:
+        digest = export_cache.image_digest(image)
+        if digest in by_digest:
+            filenames[image.name] = by_digest[digest][1]
+            duplicates.append((image, by_digest[digest][0]))
+            continue
+
+        # Different images can sanitise to the same name; keep their files apart
+        base = sanitize_filename(image.name.replace(' ', '_'))
+        filename = base + ".png"
+        suffix = 2
+        while filename in filenames.values():
+            filename = f"{base}_{suffix}.png"
+            suffix += 1
+        by_digest[digest] = (image, filename)
+        filenames[image.name] = filename
+        unique.append((image, filename, digest))
+    return unique, filenames, duplicates
+
+def plan_texture_atlases(scene, material_index, max_size):
+    # Materials that get identical .def settings and keep their UVs inside 0-1 are laid out in
+    # square power-of-two cells, largest first, in as few atlases of at most max_size as needed
+    unit_uv_materials = materials_with_unit_uvs(scene)
+    groups = {}
+    for material, entry in material_index.items():
+        if entry['principled'] is None or material.name not in unit_uv_materials:
+            continue
+        if any(name in texture_dict and name not in ATLAS_INPUTS for name, image in entry['textures']):
+            continue
+        key = (
+            tuple(round(value, 6) for value in material.line_color),
+            tuple(round(value, 6) for value in material.diffuse_color[:3]),
+        )
+        groups.setdefault(key, []).append(material)
+
+    atlases = []
+    for materials in groups.values():
+        if len(materials) < 2:
+            continue
+        cells = sorted(
+            ((material, atlas_cell_size(material_index[material], max_size, material_texture_limit(material, scene)))
+             for material in materials),
+            key=lambda cell: -cell[1],
+        )
+        for cells_in_atlas in pack_atlas_cells(cells, max_size):
+            if len(cells_in_atlas) < 2:
+                continue
+            width = next_power_of_two(max(x + size for material, x, y, size in cells_in_atlas))
+            height = next_power_of_two(max(y + size for material, x, y, size in cells_in_atlas))
+            atlases.append({
+                'name': f"{sanitize_filename(scene.model_name)}_Atlas{len(atlases)}",
+                'width': width,
+                'height': height,
+                'cells': cells_in_atlas,
+                'line_color': tuple(materials[0].line_color),
+                'diffuse_color': tuple(materials[0].diffuse_color),
+            })
+    return atlases
+
+def materials_with_unit_uvs(scene):
+    # Names of materials whose faces all have UVs in 0-1 on the first UV map; tiling UVs can't share an atlas
+    inside = {}
+    for obj in scene.objects:
+        if obj.type != 'MESH':
+            continue
+        mesh = obj.data
+        slots = [slot.material.name if slot.material else None for slot in obj.material_slots]
+        if not mesh.uv_layers:
+            for name in slots:
+                inside[name] = False
+            continue
+
+        uvs = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+        mesh.uv_layers[0].data.foreach_get('uv', uvs)
+        loop_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+        mesh.polygons.foreach_get('loop_total', loop_totals)
+        material_indices = np.empty(len(mesh.polygons), dtype=np.int32)
+        mesh.polygons.foreach_get('material_index', material_indices)
+        loop_materials = np.repeat(material_indices, loop_totals)
+        in_range = np.all((uvs.reshape(-1, 2) >= -ATLAS_UV_EPSILON) & (uvs.reshape(-1, 2) <= 1.0 + ATLAS_UV_EPSILON), axis=1)
+        for index, name in enumerate(slots):
+            used = loop_materials == index
+            if used.any():
+                inside[name] = inside.get(name, True) and bool(in_range[used].all())
+    return {name for name, ok in inside.items() if ok and name}
+
+def atlas_cell_size(entry, max_size, texture_limit=0):
+    sizes = [max(image.size) for name, image in entry['textures'] if name in ATLAS_INPUTS]
+    sizes += [max(image.size) for name, image in entry['linked'].items() if name in MASK_MAP_INPUTS and image]
+    size = next_power_of_two(max(sizes, default=ATLAS_MIN_CELL))
+    if texture_limit:
+        size = min(size, next_power_of_two(texture_limit + 1) // 2)
+    return min(max_size, max(ATLAS_MIN_CELL, size))
+
+def next_power_of_two(value):
+    return 1 << max(0, int(value) - 1).bit_length()
+
+def pack_atlas_cells(cells, max_size):
+    # Shelf packing; with power-of-two squares sorted largest first, rows fill without gaps
+    atlases = []
+    current = []
+    x = y = row_height = 0
+    for material, size in cells:
+        if x + size > max_size:
+            x, y, row_height = 0, y + row_height, 0
+        if y + size > max_size:
+            atlases.append(current)
+            current = []
+            x = y = row_height = 0
+        current.append((material, x, y, size))
+        row_height = max(row_height, size)
+        x += size
+    if current:
+        atlases.append(current)
+    return atlases
+
+def atlas_signature(atlases):
+    return [
+        (atlas['name'], atlas['width'], atlas['height'], [(material.name, x, y, size) for material, x, y, size in atlas['cells']])
+        for atlas in atlases
+    ]
+
+def create_atlas_material(atlas):
+    # A stand-in Principled material for the FBX and the .def; its image nodes point at the atlas files
+    material = bpy.data.materials.new(sanitize_material_name(atlas['name']))
+    material.line_color = atlas['line_color']
+    material.diffuse_color = atlas['diffuse_color']
+    material.use_nodes = True
+    nodes = material.node_tree.nodes
+    links = material.node_tree.links
+    principled = next(node for node in nodes if node.type == 'BSDF_PRINCIPLED')
+
+    images = []
+    for input_name, suffix in (('Base Color', "Base"), ('Normal', "Normal")):
+        image = bpy.data.images.new(f"{atlas['name']}_{suffix}", width=1, height=1)
+        image.filepath_raw = f"//{atlas['name']}_{suffix}.png"
+        images.append(image)
+        texture = nodes.new('ShaderNodeTexImage')
+        texture.image = image
+        if input_name == 'Normal':
+            normal_map = nodes.new('ShaderNodeNormalMap')
+            links.new(texture.outputs['Color'], normal_map.inputs['Color'])
+            links.new(normal_map.outputs['Normal'], principled.inputs['Normal'])
+        else:
+            links.new(texture.outputs['Color'], principled.inputs[input_name])
+    return material, images
+
+def image_bytes(image, width, height):
+    # 8-bit pixels the way save_texture would write them, resized to width x height
+    pixels = read_image_pixels(image)
+    if pixels.size == 0:
+        return None
+    pixels = resample_pixels(pixels, width, height)
+    if image.is_float and not image.colorspace_settings.is_data:
+        pixels[..., :3] = linear_to_srgb(pixels[..., :3])
+    return float_to_byte(pixels)
+
+def build_atlas_images(atlas, material_index, scene):
+    # Base colour, normal and mask map atlases as 8-bit arrays, bottom row first like Blender.
+    # Each cell holds its texture shrunk by the padding, with edge pixels repeated into the gutter.
+    width, height = atlas['width'], atlas['height']
+    base = np.full((height, width, 4), 255, dtype=np.uint8)
+    normal = np.empty((height, width, 4), dtype=np.uint8)
+    normal[...] = ATLAS_FLAT_NORMAL
+    mask = np.zeros((height, width, 4), dtype=np.uint8)
+    mask[..., 3] = 255
+
+    for material, x, y, size in atlas['cells']:
+        entry = material_index[material]
+        inner = size - 2 * ATLAS_PADDING
+        textures = dict(reversed(entry['textures']))
+        cell = (slice(y, y + size), slice(x, x + size))
+
+        for input_name, target in (('Base Color', base), ('Normal', normal)):
+            if input_name in textures:
+                pixels = image_bytes(textures[input_name], inner, inner)
+                if pixels is not None:
+                    target[cell] = np.pad(pixels, ((ATLAS_PADDING, ATLAS_PADDING), (ATLAS_PADDING, ATLAS_PADDING), (0, 0)), mode='edge')
+
+        linked = entry['linked']
+        sources = (
+            (linked.get('Emission Color'), scene.invert_emissive),
+            (linked.get('Roughness'), scene.invert_roughness),
+            (linked.get('Metallic'), scene.invert_metallic),
+            (linked.get('Specular Tint') or linked.get('IOR Level'), scene.invert_specular),
+        )
+        values = [image_channel_value(image, inner, inner, invert) for image, invert in sources]
+        packed = pack_mask_map(inner, inner, *values)
+        mask[cell] = np.pad(packed, ((ATLAS_PADDING, ATLAS_PADDING), (ATLAS_PADDING, ATLAS_PADDING), (0, 0)), mode='edge')
+
+    return {'Base': base, 'Normal': normal, 'MaskMap': mask}
+
+def remap_atlas_uvs(mesh, slots, placements):
+    # Moves the first UV map of every face using an atlased material into its cell
+    if not mesh.uv_layers:
+        return
+    uv_data = mesh.uv_layers[0].data
+    uvs = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+    uv_data.foreach_get('uv', uvs)
+    uvs = uvs.reshape(-1, 2)
+    loop_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get('loop_total', loop_totals)
+    material_indices = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get('material_index', material_indices)
+    loop_materials = np.repeat(material_indices, loop_totals)
+
+    for index, name in enumerate(slots):
+        if name not in placements:
+            continue
+        atlas, x, y, size = placements[name][1:]
+        used = loop_materials == index
+        inner = size - 2 * ATLAS_PADDING
+        uvs[used, 0] = (x + ATLAS_PADDING + uvs[used, 0] * inner) / atlas['width']
+        uvs[used, 1] = (y + ATLAS_PADDING + uvs[used, 1] * inner) / atlas['height']
+    uv_data.foreach_set('uv', uvs.ravel())
+
+@contextlib.contextmanager
+def atlas_mesh_copies(scene, atlases, atlas_materials):
+    # Swaps every affected object onto a remapped copy of its mesh for the FBX export, then puts
+    # the original meshes and materials back; the .blend itself is never changed
+    placements = {}
+    for atlas, atlas_material in zip(atlases, atlas_materials):
+        for material, x, y, size in atlas['cells']:
+            placements[material.name] = (atlas_material, atlas, x, y, size)
+
+    def slot_names(obj):
+        return tuple(slot.material.name if slot.material else None for slot in obj.material_slots)
+
+    def remapped_copy(obj):
+        slots = slot_names(obj)
+        mesh = obj.data.copy()
+        remap_atlas_uvs(mesh, slots, placements)
+        for index, name in enumerate(slots):
+            if name in placements and index < len(mesh.materials):
+                mesh.materials[index] = placements[name][0]
+        return mesh
+
+    # Objects sharing a mesh but not their object-linked materials need copies of their own
+    objects = [
+        obj for obj in scene.objects
+        if obj.type == 'MESH' and any(name in placements for name in slot_names(obj))
+    ]
+    slot_changes = []
+    with swapped_meshes(objects, remapped_copy, key=lambda obj: (obj.data.name, slot_names(obj))):
+        try:
+            for obj in objects:
+                for slot in obj.material_slots:
+                    if slot.link == 'OBJECT' and slot.material and slot.material.name in placements:
+                        slot_changes.append((slot, slot.material))
+                        slot.material = placements[slot.material.name][0]
+            yield
+        finally:
+            for slot, material in slot_changes:
+                slot.material = material
+
+@contextlib.contextmanager
+def swapped_meshes(objects, make_copy, key=lambda obj: obj.data.name):
+    # Swaps each object onto make_copy(obj) for the length of the block, one copy per key so objects
+    # sharing a mesh share the copy, then puts the original meshes back and removes the copies
+    copies = {}
+    swapped = []
+    try:
+        for obj in objects:
+            mesh_key = key(obj)
+            if mesh_key not in copies:
+                copies[mesh_key] = make_copy(obj)
+            swapped.append((obj, obj.data))
+            obj.data = copies[mesh_key]
+        yield
+    finally:
+        for obj, mesh in swapped:
+            obj.data = mesh
+        for mesh in copies.values():
+            bpy.data.meshes.remove(mesh)
+
+def parse_lod_ratios(text):
+    # "0.5, 0.25, 0.1" -> [0.5, 0.25, 0.1]: the share of triangles each LOD keeps
+    ratios = []
+    for part in text.replace(';', ',').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            ratio = float(part)
+        except ValueError:
+            raise ValueError(f"LOD ratio '{part}' is not a number")
+        if not 0.0 < ratio < 1.0:
+            raise ValueError(f"LOD ratio {ratio} must be between 0 and 1")
+        ratios.append(ratio)
+    return ratios
+
+def mesh_triangle_count(mesh):
+    loop_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get('loop_total', loop_totals)
+    return int((loop_totals - 2).sum())
+
+def scene_triangle_count(scene):
+    return sum(mesh_triangle_count(obj.data) for obj in scene.objects if obj.type == 'MESH')
+
+def decimated_mesh(scene, mesh, ratio, min_triangles):
+    # Evaluates a Decimate modifier on a throwaway object and keeps the result as a new mesh.
+    # Vertex weights, UVs and material slots survive the collapse; meshes at or below
+    # min_triangles are never reduced further.
+    triangles = mesh_triangle_count(mesh)
+    if triangles <= min_triangles:
+        return mesh.copy()
+    helper = bpy.data.objects.new("bakin_lod_helper", mesh)
+    scene.collection.objects.link(helper)
+    try:
+        modifier = helper.modifiers.new("LOD", 'DECIMATE')
+        modifier.decimate_type = 'COLLAPSE'
+        modifier.ratio = max(ratio, min_triangles / triangles)
+        modifier.use_collapse_triangulate = True
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        lod_mesh = bpy.data.meshes.new_from_object(
+            helper.evaluated_get(depsgraph), preserve_all_data_layers=True, depsgraph=depsgraph)
+    finally:
+        bpy.data.objects.remove(helper)
+    lod_mesh.name = f"{mesh.name}_LOD"
+    return lod_mesh
+
+@contextlib.contextmanager
+def lod_mesh_copies(scene, ratio, min_triangles):
+    # Swaps every mesh object onto a decimated copy of its current mesh for one LOD export, then
+    # puts the originals back. Meshes with shape keys stay at full resolution since decimating
+    # would drop the keys.
+    objects = [obj for obj in scene.objects if obj.type == 'MESH' and not obj.data.shape_keys]
+    with swapped_meshes(objects, lambda obj: decimated_mesh(scene, obj.data, ratio, min_triangles)):
+        yield
+
+def fbx_export_settings(scene):
+    # FBX_EXPORT_SETTINGS plus the animation baking options from the panel
+    settings = dict(
+        FBX_EXPORT_SETTINGS,
+        bake_anim=scene.bake_anim,
+        bake_anim_step=scene.bake_anim_step,
+        bake_anim_simplify_factor=scene.bake_anim_simplify_factor,
+    )
+    return settings
+
+def reduce_keyframes(times, values, tolerance):
+    # Indices of the samples to keep so that linear interpolation between them stays within
+    # tolerance of every sample (Ramer-Douglas-Peucker on the value error)
+    count = len(times)
+    if count <= 2:
+        return np.arange(count)
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    spans = [(0, count - 1)]
+    while spans:
+        first, last = spans.pop()
+        if last - first < 2:
+            continue
+        slope = (values[last] - values[first]) / (times[last] - times[first])
+        interpolated = values[first] + slope * (times[first + 1:last] - times[first])
+        errors = np.abs(values[first + 1:last] - interpolated)
+        worst = int(errors.argmax())
+        if errors[worst] > tolerance:
+            split = first + 1 + worst
+            keep[split] = True
+            spans.append((first, split))
+            spans.append((split, last))
+    return np.flatnonzero(keep)
+
+def reduce_action(action, tolerance, saved=None):
+    # Samples every F-curve once per frame (and at its keys) and replaces its keys with the fewest
+    # linear keys that stay within tolerance. Curves with modifiers or constant (stepped) keys are
+    # left alone. The keys of every curve changed are appended to saved as (fcurve, state) first.
+    # Returns (keys before, keys after).
+    before = after = 0
+    for fcurve in action.fcurves:
+        points = fcurve.keyframe_points
+        count = len(points)
+        before += count
+        if count < 3 or len(fcurve.modifiers) or any(point.interpolation == 'CONSTANT' for point in points):
+            after += count
+            continue
+
+        keys = np.empty(count * 2, dtype=np.float32)
+        points.foreach_get('co', keys)
+        key_times = keys[0::2].astype(np.float64)
+        times = np.union1d(np.arange(np.floor(key_times[0]), np.ceil(key_times[-1]) + 1.0), key_times)
+        times = times[(times >= key_times[0]) & (times <= key_times[-1])]
+        values = np.array([fcurve.evaluate(time) for time in times], dtype=np.float64)
+        kept = reduce_keyframes(times, values, tolerance)
+        if len(kept) >= count:
+            after += count
+            continue
+
+        if saved is not None:
+            saved.append((fcurve, keyframe_state(points)))
+        while len(points):
+            points.remove(points[0], fast=True)
+        points.add(len(kept))
+        points.foreach_set('co', np.stack((times[kept], values[kept]), axis=1).astype(np.float32).ravel())
+        for point in points:
+            point.interpolation = 'LINEAR'
+        fcurve.update()
+        after += len(kept)
+    return before, after
+
+def keyframe_state(points):
+    # Everything needed to rebuild a curve's keyframes exactly
+    state = {}
+    for name in KEYFRAME_VECTORS:
+        values = np.empty(len(points) * 2, dtype=np.float32)
+        points.foreach_get(name, values)
+        state[name] = values
+    state['settings'] = [tuple(getattr(point, name) for name in KEYFRAME_SETTINGS) for point in points]
+    return state
+
+def restore_keyframes(fcurve, state):
+    points = fcurve.keyframe_points
+    while len(points):
+        points.remove(points[0], fast=True)
+    points.add(len(state['settings']))
+    points.foreach_set('co', state['co'])
+    # Handle types before handle positions, so aligned or free handles keep their saved positions
+    for point, settings in zip(points, state['settings']):
+        for name, value in zip(KEYFRAME_SETTINGS, settings):
+            setattr(point, name, value)
+    for name in KEYFRAME_VECTORS:
+        points.foreach_set(name, state[name])
+    fcurve.update()
+
+@contextlib.contextmanager
+def reduced_actions(enabled=True, tolerance=0.001, stats=None):
+    # Reduces the keyframes of every local action in place for one FBX export, adding key counts to
+    # stats, and puts the saved keys back afterwards. The exporter sees the same actions, names and
+    # assignments as without reduction, whichever of its action and NLA modes is used.
+    if not enabled:
+        yield
+        return
+    saved = []
+    try:
+        for action in bpy.data.actions:
+            if action.library:
+                continue
+            before, after = reduce_action(action, tolerance, saved)
+            if after < before:
+                print(f"Action '{action.name}': {before} -> {after} keyframes")
+            if stats is not None:
+                stats['before'] = stats.get('before', 0) + before
+                stats['after'] = stats.get('after', 0) + after
+        yield
+    finally:
+        for fcurve, state in reversed(saved):
+            restore_keyframes(fcurve, state)
+
+def vertex_cache_misses(triangles, vertex_count, cache_size=VERTEX_CACHE_SIZE):
+    # Vertices a FIFO post-transform cache has to transform for this triangle order;
+    # divided by the triangle count this is the ACMR
+    stamps = [-cache_size - 1] * vertex_count
+    clock = 0
+    misses = 0
+    for vertex in triangles.ravel().tolist():
+        if clock - stamps[vertex] > cache_size:
+            stamps[vertex] = clock
+            clock += 1
+            misses += 1
+    return misses
+
+def tipsify(triangles, vertex_count, cache_size=VERTEX_CACHE_SIZE):
+    # Triangle order from Sander, Nehab and Barczak's Tipsify: emit every triangle around a fanning
+    # vertex, then move on to the neighbour most likely still in the cache, falling back to recently
+    # used vertices and finally to a scan. Returns the triangle indices in their new order.
+    if len(triangles) == 0:
+        return np.zeros(0, dtype=np.int64)
+    corners = triangles.ravel()
+    counts = np.bincount(corners, minlength=vertex_count)
+    offsets = np.concatenate(([0], np.cumsum(counts))).tolist()
+    adjacency = (np.argsort(corners, kind='stable') // 3).tolist()
+    live = counts.tolist()
+    stamps = [0] * vertex_count
+    emitted = [False] * len(triangles)
+    vertices = triangles.tolist()
+    dead_end = []
+    order = []
+    clock = cache_size + 1
+    cursor = 0
+    fan = 0
+    while fan >= 0:
+        candidates = []
+        for triangle in adjacency[offsets[fan]:offsets[fan + 1]]:
+            if emitted[triangle]:
+                continue
+            emitted[triangle] = True
+            order.append(triangle)
+            for vertex in vertices[triangle]:
+                dead_end.append(vertex)
+                candidates.append(vertex)
+                live[vertex] -= 1
+                if clock - stamps[vertex] > cache_size:
+                    stamps[vertex] = clock
+                    clock += 1
+
+        fan = -1
+        best = -1
+        for vertex in candidates:
+            if live[vertex] > 0:
+                # Prefer vertices that will still be cached after their remaining triangles are emitted
+                priority = clock - stamps[vertex] if clock - stamps[vertex] + 2 * live[vertex] <= cache_size else 0
+                if priority > best:
+                    best = priority
+                    fan = vertex
+        while fan < 0 and dead_end:
+            vertex = dead_end.pop()
+            if live[vertex] > 0:
+                fan = vertex
+        while fan < 0 and cursor < vertex_count:
+            if live[cursor] > 0:
+                fan = cursor
+            cursor += 1
+    return np.array(order, dtype=np.int64)
+
+def first_use_rank(triangles, vertex_count):
+    # New index of every vertex when vertices are numbered in the order the triangles first use them;
+    # unused vertices go last in their current order
+    corners = triangles.ravel()
+    first_use = np.full(vertex_count, len(corners), dtype=np.int64)
+    used, positions = np.unique(corners, return_index=True)
+    first_use[used] = positions
+    new_order = np.lexsort((np.arange(vertex_count), first_use))
+    rank = np.empty(vertex_count, dtype=np.int64)
+    rank[new_order] = np.arange(vertex_count)
+    return rank
+
+def optimize_vertex_cache(mesh):
+    # Triangulates the mesh the way the FBX exporter would, reorders the triangles for the vertex
+    # cache and the vertices for fetch locality. Returns (triangles, misses before, misses after).
+    bm = bmesh.new()
+    try:
+        bm.from_mesh(mesh)
+        bmesh.ops.triangulate(bm, faces=bm.faces[:])
+        bm.verts.index_update()
+        bm.faces.index_update()
+        vertex_count = len(bm.verts)
+        triangles = np.array([[vert.index for vert in face.verts] for face in bm.faces], dtype=np.int64).reshape(-1, 3)
+        before = vertex_cache_misses(triangles, vertex_count)
+        order = tipsify(triangles, vertex_count)
+        after = vertex_cache_misses(triangles[order], vertex_count)
+        if after < before:
+            position = np.empty(len(order), dtype=np.int64)
+            position[order] = np.arange(len(order))
+            position = position.tolist()
+            rank = first_use_rank(triangles[order], vertex_count).tolist()
+            bm.faces.sort(key=lambda face: position[face.index])
+            bm.verts.sort(key=lambda vert: rank[vert.index])
+        else:
+            after = before
+        bm.to_mesh(mesh)
+    finally:
+        bm.free()
+    return len(triangles), before, after
+
+@contextlib.contextmanager
+def vertex_cache_mesh_copies(scene, enabled=True, stats=None):
+    # Swaps every mesh object onto a cache-optimised copy of its current mesh for one FBX export,
+    # adding triangle and miss totals to stats; the originals are put back afterwards
+    if not enabled:
+        yield
+        return
+    def optimized_copy(obj):
+        mesh = obj.data.copy()
+        triangles, before, after = optimize_vertex_cache(mesh)
+        if triangles:
+            print(f"Vertex cache '{obj.data.name}': ACMR {before / triangles:.3f} -> {after / triangles:.3f}")
+        if stats is not None:
+            stats['triangles'] = stats.get('triangles', 0) + triangles
+            stats['misses_before'] = stats.get('misses_before', 0) + before
+            stats['misses_after'] = stats.get('misses_after', 0) + after
+        return mesh
+
+    with swapped_meshes([obj for obj in scene.objects if obj.type == 'MESH'], optimized_copy):
+        yield
 
 def create_dummy_image(name, width, height):
     dummy_image = bpy.data.images.new(name, width=width, height=height)
     dummy_image.generated_color = (0.0, 0.0, 0.0, 1.0)
     return dummy_image
 
-def generate_unity_mask_map(material, output_path):
+def generate_unity_mask_map(material, output_path, mask_map_cache=None, export_cache=None, writer=None, material_index=None):
     if not material.use_nodes:
         print(f"Material '{material.name}' does not use nodes.")
         return None
 
-    node_tree = material.node_tree
-    nodes = node_tree.nodes
-
-    # Find the Principled BSDF node
-    principled_bsdf = None
-    for node in nodes:
-        if node.type == 'BSDF_PRINCIPLED':
-            principled_bsdf = node
-            break
-
-    if not principled_bsdf:
+    entry = material_index[material] if material_index is not None else index_material(material)
+    if entry['principled'] is None:
         print(f"No Principled BSDF shader found in material '{material.name}'.")
         return None
 
-    # Function to safely get the image from a node
-    def get_image_from_node(input_socket):
-        if input_socket and input_socket.is_linked:
-            link = input_socket.links[0]
-            if link.from_node and link.from_node.type == 'TEX_IMAGE':
-                return link.from_node.image
-        return None
-
     # Get connected textures
-    metallic_tex_image = get_image_from_node(principled_bsdf.inputs.get('Metallic', None))
-    roughness_tex_image = get_image_from_node(principled_bsdf.inputs.get('Roughness', None))
-    emissive_tex_image = get_image_from_node(principled_bsdf.inputs.get('Emission Color', None))
-    specular_tex_image = get_image_from_node(principled_bsdf.inputs.get('Specular Tint', None))
+    linked = entry['linked']
+    metallic_tex_image = linked.get('Metallic')
+    roughness_tex_image = linked.get('Roughness')
+    emissive_tex_image = linked.get('Emission Color')
+    specular_tex_image = linked.get('Specular Tint')
     
     if(specular_tex_image == None):
-        specular_tex_image = get_image_from_node(principled_bsdf.inputs.get('IOR Level', None))
+        specular_tex_image = linked.get('IOR Level')
 
-    # Default size if no textures are found
+    scene = bpy.context.scene
+
+    sources = (
+        (emissive_tex_image, scene.invert_emissive),
+        (roughness_tex_image, scene.invert_roughness),
+        (metallic_tex_image, scene.invert_metallic),
+        (specular_tex_image, scene.invert_specular),
+    )
+
+    # Materials resolving to the same images, invert flags and texture budget share one mask map.
+    # With an export cache the key is the image content, so duplicated image datablocks share it too.
+    # The size follows from those, so it is only read (which decodes the sources) when both caches miss.
+    limit = material_texture_limit(material, scene)
+    cache_key = (mask_map_key(sources), limit, scene.use_power_of_two_textures)
+    if export_cache is not None:
+        digest = hashlib.sha1(repr([
+            (export_cache.image_digest(image), bool(invert)) if image else None for image, invert in sources
+        ] + [limit, scene.use_power_of_two_textures]).encode()).hexdigest()
+        cache_key = digest
+    if mask_map_cache is not None and cache_key in mask_map_cache:
+        return mask_map_cache[cache_key]
+
+    # A previous export may already have packed these exact pixels
+    if export_cache is not None:
+        entry = export_cache.lookup('mask_maps', digest, digest)
+        if entry is not None:
+            export_cache.record('mask_maps', digest, digest, files=entry['files'])
+            output_filename = entry['files'][0][:-len(".png")]
+            if mask_map_cache is not None:
+                mask_map_cache[cache_key] = output_filename
+            return output_filename
+
+    # Every source is resampled to the size of the largest one, within the material's texture budget
     width, height = 1024, 1024
-    if metallic_tex_image:
-        width, height = metallic_tex_image.size
-    elif roughness_tex_image:
-        width, height = roughness_tex_image.size
-    elif emissive_tex_image:
-        width, height = emissive_tex_image.size
-    elif specular_tex_image:
-        width, height = specular_tex_image.size
-
-    # Set up compositing
-    comp_scene = bpy.context.scene
-    comp_scene.use_nodes = True
-
-    comp_tree = comp_scene.node_tree
-    comp_nodes = comp_tree.nodes
-    comp_links = comp_tree.links
-
-    # Clear existing nodes
-    for node in comp_nodes:
-        comp_nodes.remove(node)
-
-    # Add Image nodes
-    metallic_node = comp_nodes.new(type='CompositorNodeImage')
-    metallic_node.image = metallic_tex_image
-
-    roughness_node = comp_nodes.new(type='CompositorNodeImage')
-    roughness_node.image = roughness_tex_image
-
-    emissive_node = comp_nodes.new(type='CompositorNodeImage')
-    emissive_node.image = emissive_tex_image
-    
-    # Add Invert node for Roughness to Smoothness conversion
-    invert_node_e = comp_nodes.new(type='CompositorNodeInvert')
-    invert_node_m = comp_nodes.new(type='CompositorNodeInvert')
-    invert_node_r = comp_nodes.new(type='CompositorNodeInvert')
-    invert_node_s = comp_nodes.new(type='CompositorNodeInvert')
-
-    specular_node = comp_nodes.new(type='CompositorNodeImage')
-    specular_node.image = specular_tex_image
-
-    # Add Combine RGBA node
-    combine_node = comp_nodes.new(type='CompositorNodeCombRGBA')
-
-    # Add Output File node
-    output_filename = f"{sanitize_filename(bpy.context.scene.model_name)}_MaskMap"
-    output_node = comp_nodes.new(type='CompositorNodeOutputFile')
-    output_node.base_path = output_path
-    output_node.file_slots[0].path = output_filename
-
-    if roughness_tex_image and bpy.context.scene.invert_roughness:
-        comp_links.new(roughness_node.outputs['Image'], invert_node_r.inputs['Color'])
-        comp_links.new(invert_node_r.outputs['Color'], combine_node.inputs['G'])
-    elif roughness_tex_image:
-        comp_links.new(roughness_node.outputs['Image'], combine_node.inputs['G'])
-
-    if metallic_tex_image and bpy.context.scene.invert_metallic:
-        comp_links.new(metallic_node.outputs['Image'], invert_node_e.inputs['Color'])
-        comp_links.new(invert_node_e.outputs['Color'], combine_node.inputs['B'])
-    elif metallic_tex_image:
-        comp_links.new(metallic_node.outputs['Image'], combine_node.inputs['B'])
-
-    if emissive_tex_image and bpy.context.scene.invert_emissive:
-        comp_links.new(emissive_node.outputs['Image'], invert_node_e.inputs['Color'])
-        comp_links.new(invert_node_e.outputs['Color'], combine_node.inputs['R'])
-    elif emissive_tex_image:
-        comp_links.new(emissive_node.outputs['Image'], combine_node.inputs['R'])
-
-    if specular_tex_image and bpy.context.scene.invert_specular:
-        comp_links.new(specular_node.outputs['Image'], invert_node_s.inputs['Color'])
-        comp_links.new(invert_node_s.outputs['Color'], combine_node.inputs['A'])
-    elif specular_tex_image:
-        comp_links.new(specular_node.outputs['Image'], combine_node.inputs['A'])
-    
-    comp_links.new(combine_node.outputs['Image'], output_node.inputs['Image'])
+    linked_images = [image for image, invert in sources if image is not None]
+    if linked_images:
+        width, height = max((tuple(image.size) for image in linked_images), key=lambda size: size[0] * size[1])
+    width, height = texture_target_size(width, height, limit, scene.use_power_of_two_textures)
 
-    # Render the scene to create the image
+    # Named after the content when cached: a name taken from one material would be rewritten
+    # when that material changes, while the others sharing it still hit the old digest
+    output_filename = f"{sanitize_filename(scene.model_name)}_{sanitize_filename(material.name)}_MaskMap"
+    if export_cache is not None:
+        output_filename = f"{sanitize_filename(scene.model_name)}_MaskMap_{digest[:12]}"
     output_file_path = os.path.join(output_path, f"{output_filename}.png")
-    bpy.context.scene.render.filepath = output_file_path
-    bpy.ops.render.render(write_still=True)
 
+    # Pixels are read here on the main thread; packing and encoding can go to the writer's workers
+    tile_rows = mask_map_tile_rows(width, height, scene.mask_map_tile_budget)
+    if tile_rows < height:
+        # Too big to pack in one go: keep only 8-bit planes around and stream the PNG in bands
+        planes = mask_map_planes(sources, width, height, tile_rows)
+        job = (stream_mask_map, output_file_path, width, height, planes, tile_rows)
+        nbytes = sum(plane.nbytes for plane in planes if plane is not None)
+    else:
+        values = [image_channel_value(image, width, height, invert) for image, invert in sources]
+        job = (write_mask_map, output_file_path, width, height, values)
+        nbytes = sum(value.nbytes for value in values if value is not None)
+
+    if writer is not None:
+        writer.submit(nbytes, *job, phase='mask_map_write', output=output_file_path)
+    else:
+        job[0](*job[1:])
+
+    if export_cache is not None:
+        export_cache.record('mask_maps', digest, digest, files=[f"{output_filename}.png"])
+    if mask_map_cache is not None:
+        mask_map_cache[cache_key] = output_filename
     return output_filename
 
+def write_mask_map(filepath, width, height, values):
+    # Same layout as the old compositor graph: R=emissive, G=roughness, B=metallic, A=specular
+    write_png(filepath, pack_mask_map(width, height, *values))
+
+def mask_map_tile_rows(width, height, budget_mb):
+    # Rows per band so a band's working set fits the budget; all rows when the whole map already fits
+    budget = budget_mb * 1024 * 1024
+    if budget <= 0 or width * height * MASK_MAP_BYTES_PER_PIXEL <= budget:
+        return height
+    return max(1, min(height, budget // (width * MASK_MAP_TILE_BYTES_PER_PIXEL)))
+
+def mask_map_planes(sources, width, height, tile_rows):
+    # One source is held as floats at a time, reduced to its value and resampled band by band to an 8-bit plane
+    planes = []
+    for image, invert in sources:
+        pixels = read_image_pixels(image) if image is not None else None
+        if pixels is None or pixels.size == 0:
+            planes.append(None)
+            continue
+        value = rgb_value(pixels)
+        del pixels
+        plane = np.empty((height, width), dtype=np.uint8)
+        for start in range(0, height, tile_rows):
+            stop = min(start + tile_rows, height)
+            plane[start:stop] = float_to_byte(channel_value(value, width, height, invert, start, stop))
+        planes.append(plane)
+        del value
+    return planes
+
+def stream_mask_map(filepath, width, height, planes, tile_rows):
+    # PNG rows run top-down, so bands are taken from the end of Blender's bottom-up planes
+    band = np.empty((tile_rows, width, 4), dtype=np.uint8)
+    with PNGStreamWriter(filepath, width, height, 4) as png:
+        for top in range(0, height, tile_rows):
+            stop = height - top
+            start = max(0, stop - tile_rows)
+            rows = band[:stop - start]
+            for index, plane in enumerate(planes):
+                if plane is not None:
+                    rows[..., index] = plane[start:stop]
+                else:
+                    # Combine RGBA defaults for unlinked channels
+                    rows[..., index] = 255 if index == 3 else 0
+            png.write_rows(rows[::-1])
+
+def mask_map_key(sources):
+    # Inverting an unlinked channel changes nothing, so only linked channels carry their flag
+    return tuple((image.name, bool(invert)) if image else None for image, invert in sources)
+
+def read_image_pixels(image):
+    # Bulk read into a (height, width, 4) float buffer, bottom row first like Blender stores it
+    width, height = image.size
+    channels = image.channels
+    pixels = np.empty(width * height * channels, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    pixels = pixels.reshape(height, width, channels)
+    if channels == 4:
+        return pixels
+
+    rgba = np.ones((height, width, 4), dtype=np.float32)
+    if channels >= 3:
+        rgba[..., :3] = pixels[..., :3]
+    else:
+        rgba[..., :3] = pixels[..., :1]
+        if channels == 2:
+            rgba[..., 3] = pixels[..., 1]
+    return rgba
+
+def image_channel_value(image, width, height, invert=False):
+    if image is None:
+        return None
+
+    # Reading the pixels loads the image if Blender hasn't yet; missing files come back empty
+    pixels = read_image_pixels(image)
+    if pixels.size == 0:
+        return None
+    return channel_value(rgb_value(pixels), width, height, invert)
+
+def rgb_value(pixels):
+    # The compositor converted colour to value by averaging RGB when linking into Combine RGBA
+    return (pixels[..., 0] + pixels[..., 1] + pixels[..., 2]) / np.float32(3.0)
+
+def channel_value(value, width, height, invert=False, start=0, stop=None):
+    # Rows start:stop of the mask map channel: resampled to the map's size, then inverted. Both the
+    # whole-image and the banded path go through here, so they produce the same bytes.
+    value = resample_pixels(value, width, height, start, stop)
+    if invert:
+        value = np.float32(1.0) - value
+    return value
+
+def resample_pixels(pixels, width, height, start=0, stop=None):
+    # Rows start:stop of a (height, width[, channels]) float array resized to width x height.
+    # Whole-number reductions average blocks of pixels (box filter) and whatever is left is
+    # bilinear. Every output row only reads its own source rows, so resizing in bands gives
+    # the same result as resizing the whole image.
+    if stop is None:
+        stop = height
+    source_height, source_width = pixels.shape[:2]
+    if (source_height, source_width) == (height, width):
+        return pixels[start:stop]
+
+    row_factor = box_factor(source_height, height)
+    col_factor = box_factor(source_width, width)
+    rows0, rows1, row_weights = bilinear_taps(source_height // row_factor, height, start, stop)
+    first, last = int(rows0.min()), int(rows1.max()) + 1
+
+    block = pixels[first * row_factor:last * row_factor]
+    if row_factor > 1:
+        block = block.reshape(last - first, row_factor, *block.shape[1:]).mean(axis=1)
+    if col_factor > 1:
+        block = block.reshape(block.shape[0], source_width // col_factor, col_factor, *block.shape[2:]).mean(axis=2)
+    block = block.astype(np.float32, copy=False)
+
+    extra = (None,) * (block.ndim - 2)
+    if row_weights.any():
+        weights = row_weights[(slice(None), None) + extra]
+        block = block[rows0 - first] * (np.float32(1.0) - weights) + block[rows1 - first] * weights
+    else:
+        block = block[rows0 - first]
+    if block.shape[1] != width:
+        cols0, cols1, col_weights = bilinear_taps(block.shape[1], width, 0, width)
+        weights = col_weights[(None, slice(None)) + extra]
+        block = block[:, cols0] * (np.float32(1.0) - weights) + block[:, cols1] * weights
+    return block
+
+def box_factor(source, target):
+    # Largest whole number of source pixels per target pixel that divides the source evenly
+    if target >= source:
+        return 1
+    factor = source // target
+    while source % factor:
+        factor -= 1
+    return factor
+
+def bilinear_taps(source, target, start, stop):
+    # Source indices on either side of each target pixel centre in start:stop, and the weight of the second
+    centres = (np.arange(start, stop) + 0.5) * (source / target) - 0.5
+    centres = np.clip(centres, 0, source - 1)
+    lower = np.floor(centres).astype(np.int64)
+    upper = np.minimum(lower + 1, source - 1)
+    return lower, upper, (centres - lower).astype(np.float32)
+
+def texture_target_size(width, height, max_size=0, power_of_two=False):
+    # Export size of a width x height texture: scaled down to fit max_size (0 = no limit) keeping its
+    # aspect ratio. With power_of_two the longest side snaps to the nearest power of two that still
+    # fits and sets the scale for the other side, which is then snapped as well.
+    if not width or not height:
+        return max(1, width), max(1, height)
+    longest = max(width, height)
+    scale = min(1.0, max_size / longest) if max_size > 0 else 1.0
+    if power_of_two:
+        scale = nearest_power_of_two(max(1, int(round(longest * scale))), max_size) / longest
+    size = [max(1, int(round(width * scale))), max(1, int(round(height * scale)))]
+    if power_of_two:
+        size = [nearest_power_of_two(value, max_size) for value in size]
+    return tuple(size)
+
+def nearest_power_of_two(value, max_size=0):
+    lower = 1 << (value.bit_length() - 1)
+    value = lower if value - lower < lower * 2 - value else lower * 2
+    return value if max_size <= 0 or value <= max_size else lower
+
+def material_texture_limit(material, scene):
+    # A material's own budget wins over the export-wide one; 0 means no limit
+    return getattr(material, 'bakin_max_texture_size', 0) or scene.max_texture_size
+
+def texture_size_limits(scene, material_index):
+    # Image name -> max size. An image shared by several materials gets the most generous budget so
+    # no material loses detail it asked for.
+    limits = {}
+    for material, entry in material_index.items():
+        limit = material_texture_limit(material, scene)
+        for image in entry['images']:
+            limits[image.name] = merge_texture_limits(limits.get(image.name, limit), limit)
+    return limits
+
+def merge_texture_limits(first, second):
+    return 0 if not first or not second else max(first, second)
+
+def pack_mask_map(width, height, emissive=None, roughness=None, metallic=None, specular=None):
+    # Unlinked channels keep the Combine RGBA defaults: 0 for RGB, 1 for alpha
+    mask_map = np.zeros((height, width, 4), dtype=np.float32)
+    mask_map[..., 3] = 1.0
+    for index, value in enumerate((emissive, roughness, metallic, specular)):
+        if value is not None:
+            mask_map[..., index] = value
+    return float_to_byte(mask_map)
+
+def float_to_byte(pixels):
+    return (np.clip(pixels, 0.0, 1.0) * np.float32(255.0) + np.float32(0.5)).astype(np.uint8)
+
+def linear_to_srgb(values):
+    values = np.maximum(values, np.float32(0.0))
+    return np.where(
+        values <= np.float32(0.0031308),
+        values * np.float32(12.92),
+        np.float32(1.055) * np.power(values, np.float32(1.0 / 2.4)) - np.float32(0.055),
+    ).astype(np.float32)
+
+def save_texture(image, filepath, writer, size=None):
+    # Unmodified PNG files at their export size are copied as-is; anything else is read here,
+    # then resized and encoded by a worker. The image datablock itself is never changed.
+    size = tuple(size or image.size)
+    source_path = bpy.path.abspath(image.filepath, library=image.library) if image.source == 'FILE' else ""
+    if (source_path and not image.packed_file and not image.is_dirty and image.file_format == 'PNG'
+            and os.path.isfile(source_path) and size == tuple(image.size)):
+        writer.submit(0, shutil.copyfile, source_path, filepath, phase='texture_write', output=filepath)
+        return
+
+    pixels = read_image_pixels(image)
+    # Float buffers hold linear values; byte PNGs are expected to be sRGB encoded
+    linear = image.is_float and not image.colorspace_settings.is_data
+    writer.submit(pixels.nbytes, encode_texture, filepath, pixels, linear, size, phase='texture_write', output=filepath)
+
+def encode_texture(filepath, pixels, linear=False, size=None):
+    if size is not None:
+        pixels = resample_pixels(pixels, *size)
+    if linear:
+        pixels[..., :3] = linear_to_srgb(pixels[..., :3])
+    write_png(filepath, float_to_byte(pixels))
+
+class TextureWriter:
+    # Encodes and writes PNGs on a pool of worker threads. bpy must only be touched by the caller;
+    # the workers just run NumPy and zlib, which release the GIL while they work.
+
+    def __init__(self, max_workers=0, memory_limit=0, report=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1)
+        self.memory_limit = memory_limit
+        self.report = report
+        self.in_flight = 0
+        self.condition = threading.Condition()
+        self.futures = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        # Drops writes that haven't started yet and waits for the running ones
+        for future in self.futures:
+            future.cancel()
+        self.executor.shutdown(wait=True)
+
+    def wait(self, timeout=None):
+        # True once every queued write is done
+        return not wait_futures(self.futures, timeout=timeout).not_done
+
+    def submit(self, nbytes, function, *args, phase='write', output=None):
+        # Blocks while the queued buffers would exceed the memory limit; one job always gets through
+        with self.condition:
+            while self.in_flight and self.memory_limit and self.in_flight + nbytes > self.memory_limit:
+                self.condition.wait()
+            self.in_flight += nbytes
+        future = self.executor.submit(self._run, nbytes, function, args, phase, output)
+        self.futures.append(future)
+        return future
+
+    def _run(self, nbytes, function, args, phase, output):
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            with self.condition:
+                self.in_flight -= nbytes
+                self.condition.notify_all()
+            if self.report is not None and output is not None:
+                self.report.add({
+                    'phase': phase,
+                    'item': os.path.basename(output),
+                    'seconds': time.perf_counter() - start,
+                    'bytes': os.path.getsize(output) if os.path.isfile(output) else 0,
+                    'peak_memory': None,
+                })
+
+    def finish(self):
+        # Waits for every queued write and re-raises the first error from a worker
+        futures, self.futures = self.futures, []
+        for future in futures:
+            future.result()
+
+def _png_chunk(tag, data):
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+def write_png(filepath, pixels):
+    # pixels is an 8-bit (height, width, channels) array stored bottom row first, as read from Blender
+    height, width, channels = pixels.shape
+    with PNGStreamWriter(filepath, width, height, channels) as png:
+        png.write_rows(pixels[::-1])
+
+class PNGStreamWriter:
+    # Writes an 8-bit PNG from top-down bands of rows. IDAT chunks are cut at fixed sizes of the
+    # compressed stream, so the file is the same however the rows were split into bands.
+
+    def __init__(self, filepath, width, height, channels):
+        self.width = width
+        self.channels = channels
+        self.file = open(filepath, 'wb')
+        self.compressor = zlib.compressobj(PNG_COMPRESSION_LEVEL)
+        self.pending = b''
+
+        color_type = {1: 0, 2: 4, 3: 2, 4: 6}[channels]
+        self.file.write(PNG_SIGNATURE)
+        self.file.write(_png_chunk(b'IHDR', struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+        return False
+
+    def write_rows(self, rows):
+        raw = np.zeros((len(rows), self.width * self.channels + 1), dtype=np.uint8)
+        raw[:, 1:] = rows.reshape(len(rows), self.width * self.channels)
+        self.pending += self.compressor.compress(raw.tobytes())
+        self._write_chunks()
+
+    def _write_chunks(self, final=False):
+        while len(self.pending) >= PNG_IDAT_SIZE or (final and self.pending):
+            self.file.write(_png_chunk(b'IDAT', self.pending[:PNG_IDAT_SIZE]))
+            self.pending = self.pending[PNG_IDAT_SIZE:]
+
+    def close(self):
+        self.pending += self.compressor.flush()
+        self._write_chunks(final=True)
+        self.file.write(_png_chunk(b'IEND', b''))
+        self.file.close()
+
+class ExportCache:
+    # Manifest of content hashes from the previous export, used to skip unchanged outputs
+
+    def __init__(self, dirpath, model_name, enabled=True):
+        self.dirpath = dirpath
+        self.filepath = os.path.join(dirpath, model_name + ".manifest.json")
+        # The last manifest is still read with the cache off: merging the .def compares against it
+        self.last_export = self.load()
+        self.previous = self.last_export if enabled else {}
+        self.current = {'version': MANIFEST_VERSION}
+        self.image_digests = {}
+
+    def load(self):
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION:
+            return {}
+        return manifest
+
+    def save(self, filepath=None):
+        with open(filepath or self.filepath, 'w', encoding='utf-8') as f:
+            json.dump(self.current, f, indent=1, sort_keys=True)
+
+    def lookup(self, section, key, digest):
+        # The previous entry, if its digest matches and every file it wrote is still there
+        entry = self.previous.get(section, {}).get(key)
+        if not entry or entry.get('digest') != digest:
+            return None
+        for filename in entry.get('files', []):
+            if not os.path.isfile(os.path.join(self.dirpath, filename)):
+                return None
+        return entry
+
+    def record(self, section, key, digest, files=(), **extra):
+        entry = dict(extra, digest=digest, files=list(files))
+        self.current.setdefault(section, {})[key] = entry
+        return entry
+
+    def stale_files(self, section):
+        # Files the previous export wrote for this section that nothing refers to any more
+        current = {filename for entry in self.current.get(section, {}).values() for filename in entry['files']}
+        previous = {filename for entry in self.previous.get(section, {}).values() for filename in entry.get('files', [])}
+        return sorted(previous - current)
+
+    def image_digest(self, image):
+        if image.name not in self.image_digests:
+            self.image_digests[image.name] = image_digest(image)
+        return self.image_digests[image.name]
+
+def image_digest(image):
+    digest = hashlib.sha1()
+    digest.update(f"{image.source}:{image.colorspace_settings.name}:{image.alpha_mode}".encode())
+
+    # Unmodified file-backed images are hashed from disk so they don't have to be loaded
+    filepath = bpy.path.abspath(image.filepath, library=image.library) if image.source == 'FILE' else ""
+    if filepath and not image.packed_file and not image.is_dirty and os.path.isfile(filepath):
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    else:
+        pixels = read_image_pixels(image)
+        digest.update(str(pixels.shape).encode())
+        digest.update(pixels.tobytes())
+    return digest.hexdigest()
+
+def material_digest(material, mask_map_filename, texture_filenames=None):
+    digest = hashlib.sha1()
+    digest.update(repr((
+        material.name, mask_map_filename, material.use_nodes,
+        tuple(material.line_color), tuple(material.diffuse_color),
+    )).encode())
+    if material.use_nodes:
+        for node in material.node_tree.nodes:
+            image = getattr(node, 'image', None)
+            filename = texture_filename(image, texture_filenames) if image else None
+            digest.update(repr((node.name, node.bl_idname, image.name if image else None, filename)).encode())
+        for link in material.node_tree.links:
+            digest.update(repr((
+                link.from_node.name, link.from_socket.identifier,
+                link.to_node.name, link.to_socket.identifier,
+            )).encode())
+    return digest.hexdigest()
+
+def _hash_array(digest, collection, attribute, dtype, width=1):
+    values = np.empty(len(collection) * width, dtype=dtype)
+    collection.foreach_get(attribute, values)
+    digest.update(values.tobytes())
+
+# Vertex weights cannot be read with foreach_get, so their hash is kept per mesh until the
+# depsgraph reports a geometry change on it (weight painting, edit mode, undo, file load)
+_weight_digests = {}
+
+def vertex_weight_digest(mesh):
+    key = (mesh.as_pointer(), mesh.name_full, len(mesh.vertices))
+    if key not in _weight_digests:
+        counts = np.empty(len(mesh.vertices), dtype=np.int32)
+        groups, weights = [], []
+        for index, vertex in enumerate(mesh.vertices):
+            elements = vertex.groups
+            counts[index] = len(elements)
+            for element in elements:
+                groups.append(element.group)
+                weights.append(element.weight)
+        digest = hashlib.sha1(counts.tobytes())
+        digest.update(np.array(groups, dtype=np.int32).tobytes())
+        digest.update(np.array(weights, dtype=np.float32).tobytes())
+        _weight_digests[key] = digest.hexdigest()
+    return _weight_digests[key]
+
+@bpy.app.handlers.persistent
+def forget_weight_digests(scene, depsgraph):
+    for update in depsgraph.updates:
+        if update.is_updated_geometry:
+            data = getattr(update.id.original, 'data', update.id.original)
+            if data is not None:
+                for key in [key for key in _weight_digests if key[0] == data.as_pointer()]:
+                    del _weight_digests[key]
+
+@bpy.app.handlers.persistent
+def clear_weight_digests(*args):
+    _weight_digests.clear()
+
+WEIGHT_DIGEST_HANDLERS = (
+    ('depsgraph_update_post', forget_weight_digests),
+    ('undo_post', clear_weight_digests),
+    ('redo_post', clear_weight_digests),
+    ('load_post', clear_weight_digests),
+)
+
+def scene_digest(scene, settings):
+    # Everything the FBX exporter reads: objects, transforms, meshes, armatures and actions
+    # Evaluating first runs the update handlers for any edit made since the last evaluation
+    bpy.context.evaluated_depsgraph_get()
+    digest = hashlib.sha1()
+    digest.update(repr(sorted(settings.items())).encode())
+
+    for obj in sorted(scene.objects, key=lambda o: o.name):
+        digest.update(repr((
+            obj.name, obj.type, obj.data.name if obj.data else None,
+            obj.parent.name if obj.parent else None, obj.parent_type, obj.parent_bone,
+            [tuple(row) for row in obj.matrix_world],
+            [slot.material.name if slot.material else None for slot in obj.material_slots],
+            [(mod.type, getattr(getattr(mod, 'object', None), 'name', None)) for mod in obj.modifiers],
+            [group.name for group in obj.vertex_groups],
+            obj.animation_data.action.name if obj.animation_data and obj.animation_data.action else None,
+        )).encode())
+
+        if obj.type == 'MESH':
+            mesh = obj.data
+            _hash_array(digest, mesh.vertices, 'co', np.float32, 3)
+            _hash_array(digest, mesh.loops, 'vertex_index', np.int32)
+            _hash_array(digest, mesh.polygons, 'loop_total', np.int32)
+            _hash_array(digest, mesh.polygons, 'material_index', np.int32)
+            _hash_array(digest, mesh.polygons, 'use_smooth', np.bool_)
+            for uv_layer in mesh.uv_layers:
+                digest.update(uv_layer.name.encode())
+                _hash_array(digest, uv_layer.data, 'uv', np.float32, 2)
+            for attribute in getattr(mesh, 'attributes', []):
+                digest.update(f"{attribute.name}:{attribute.domain}:{attribute.data_type}".encode())
+                if attribute.data_type in ATTRIBUTE_VALUES:
+                    name, width, dtype = ATTRIBUTE_VALUES[attribute.data_type]
+                    _hash_array(digest, attribute.data, name, dtype, width)
+            if mesh.shape_keys:
+                for key_block in mesh.shape_keys.key_blocks:
+                    digest.update(repr((key_block.name, key_block.value)).encode())
+                    _hash_array(digest, key_block.data, 'co', np.float32, 3)
+            if obj.vertex_groups:
+                digest.update(vertex_weight_digest(mesh).encode())
+
+        elif obj.type == 'ARMATURE':
+            bones = obj.data.bones
+            digest.update(repr([(bone.name, bone.parent.name if bone.parent else None, bone.use_deform) for bone in bones]).encode())
+            _hash_array(digest, bones, 'matrix_local', np.float32, 16)
+            _hash_array(digest, bones, 'tail_local', np.float32, 3)
+
+    # FBX bakes every action in the file, not only the assigned ones
+    for action in sorted(bpy.data.actions, key=lambda a: a.name):
+        digest.update(action.name.encode())
+        for fcurve in action.fcurves:
+            digest.update(repr((fcurve.data_path, fcurve.array_index)).encode())
+            _hash_array(digest, fcurve.keyframe_points, 'co', np.float32, 2)
+            _hash_array(digest, fcurve.keyframe_points, 'handle_left', np.float32, 2)
+            _hash_array(digest, fcurve.keyframe_points, 'handle_right', np.float32, 2)
+            digest.update(repr([point.interpolation for point in fcurve.keyframe_points]).encode())
+
+    return digest.hexdigest()
+
 class SimpleOperatorPanel(Panel):
     bl_label = "Bakin Model Exporter"
     bl_idname = "OBJECT_PT_my_simple_operator"
@@ -331,6 +2347,39 @@ class SimpleOperatorPanel(Panel):
         # Add a separator after the last checkbox
         layout.separator()
 
+        layout.label(text=TEXT[scene.language]['export_options'], icon="EXPORT")
+        layout.prop(scene, "use_export_cache", text=TEXT[scene.language]['use_export_cache'])
+        layout.prop(scene, "use_modal_export", text=TEXT[scene.language]['use_modal_export'])
+        layout.prop(scene, "merge_def_file", text=TEXT[scene.language]['merge_def_file'])
+        layout.prop(scene, "texture_threads", text=TEXT[scene.language]['texture_threads'])
+        layout.prop(scene, "texture_memory_limit", text=TEXT[scene.language]['texture_memory_limit'])
+        layout.prop(scene, "mask_map_tile_budget", text=TEXT[scene.language]['mask_map_tile_budget'])
+        layout.prop(scene, "trace_export_memory", text=TEXT[scene.language]['trace_export_memory'])
+        layout.prop(scene, "max_texture_size", text=TEXT[scene.language]['max_texture_size'])
+        layout.prop(scene, "use_power_of_two_textures", text=TEXT[scene.language]['use_power_of_two_textures'])
+        material = context.object.active_material if context.object else None
+        if material:
+            layout.prop(material, "bakin_max_texture_size", text=TEXT[scene.language]['material_max_texture_size'].format(material.name))
+        layout.prop(scene, "use_texture_atlas", text=TEXT[scene.language]['use_texture_atlas'])
+        if scene.use_texture_atlas:
+            layout.prop(scene, "atlas_max_size", text=TEXT[scene.language]['atlas_max_size'])
+        layout.prop(scene, "use_vertex_cache_optimization", text=TEXT[scene.language]['use_vertex_cache_optimization'])
+        layout.prop(scene, "use_lod", text=TEXT[scene.language]['use_lod'])
+        if scene.use_lod:
+            layout.prop(scene, "lod_ratios", text=TEXT[scene.language]['lod_ratios'])
+            layout.prop(scene, "lod_min_triangles", text=TEXT[scene.language]['lod_min_triangles'])
+        layout.separator()
+
+        layout.label(text=TEXT[scene.language]['animation_options'], icon="ACTION")
+        layout.prop(scene, "bake_anim", text=TEXT[scene.language]['bake_anim'])
+        if scene.bake_anim:
+            layout.prop(scene, "bake_anim_step", text=TEXT[scene.language]['bake_anim_step'])
+            layout.prop(scene, "bake_anim_simplify_factor", text=TEXT[scene.language]['bake_anim_simplify_factor'])
+            layout.prop(scene, "use_keyframe_reduction", text=TEXT[scene.language]['use_keyframe_reduction'])
+            if scene.use_keyframe_reduction:
+                layout.prop(scene, "keyframe_tolerance", text=TEXT[scene.language]['keyframe_tolerance'])
+        layout.separator()
+
         # Warning paragraph above the export button
         box = layout.box()
         box.label(text=TEXT[scene.language]['important_info'], icon='INFO')
@@ -341,6 +2390,30 @@ class SimpleOperatorPanel(Panel):
         for line in TEXT[scene.language]['tips_details']:
             box.label(text=line)
 
+        # Show progress instead of the button while a non-blocking export runs
+        wm = context.window_manager
+        if wm.bakin_export_running:
+            phase = TEXT[scene.language].get(wm.bakin_export_phase, wm.bakin_export_phase)
+            if hasattr(layout, "progress"):
+                layout.progress(factor=wm.bakin_export_progress, type='BAR', text=phase)
+            else:
+                layout.label(text=f"{phase} {wm.bakin_export_progress:.0%}", icon='TIME')
+            layout.operator("object.cancel_export_fbx_def", text=TEXT[scene.language]['cancel_button'], icon='CANCEL')
+            return
+
+        layout.operator("object.check_bakin_export", text=TEXT[scene.language]['check_button'], icon='VIEWZOOM')
+        if wm.bakin_export_check:
+            box = layout.box()
+            box.label(text=TEXT[scene.language]['check_results'], icon='CHECKMARK')
+            for line in wm.bakin_export_check.split("\n"):
+                box.label(text=line, icon='ERROR' if line.startswith("Error") else 'NONE')
+
+        if wm.bakin_export_summary:
+            box = layout.box()
+            box.label(text=TEXT[scene.language]['last_export'], icon='SORTTIME')
+            for line in wm.bakin_export_summary.split("\n"):
+                box.label(text=line)
+
         # Check if the blend file is saved
         is_file_saved = bpy.data.filepath != ""
 
@@ -355,6 +2428,24 @@ class SimpleOperatorPanel(Panel):
             # Enable the button if the file is saved
             layout.operator("object.export_fbx_def", text=TEXT[scene.language]['export_button'], icon='EXPORT')
 
+class CheckSceneOperator(Operator):
+    bl_idname = "object.check_bakin_export"
+    bl_label = "Check Scene"
+
+    def execute(self, context):
+        analysis = analyze_scene(context.scene)
+        lines = analysis_lines(analysis)
+        context.window_manager.bakin_export_check = "\n".join(lines)
+        for line in lines:
+            print(line)
+        if analysis['errors']:
+            self.report({'ERROR'}, f"{len(analysis['errors'])} problem(s) would stop the export (see panel).")
+        elif analysis['warnings']:
+            self.report({'WARNING'}, f"{len(analysis['warnings'])} warning(s) (see panel).")
+        else:
+            self.report({'INFO'}, f"No problems found ({analysis['seconds'] * 1000:.0f} ms).")
+        return {'FINISHED'}
+
 class SwitchLanguageOperator(Operator):
     bl_idname = "wm.switch_language"
     bl_label = "Switch Language"
@@ -372,63 +2463,109 @@ def sanitize_filename(filename):
 def sanitize_material_name(name):
     return re.sub(r'\W+', '_', unicodedata.normalize('NFKD', name).encode('ASCII', 'ignore').decode('ASCII'))
 
-def write_def_file(material, f, mask_map_filename):
+def write_def_file(material, f, mask_map_filename, material_entry=None, texture_filenames=None):
+    f.write(render_def_record(material_def_record(material, mask_map_filename, material_entry, texture_filenames)))
+
+def material_def_record(material, mask_map_filename, material_entry=None, texture_filenames=None):
+    # One .def material block as ordered (key, value) pairs
     sanitized_material_name = sanitize_material_name(material.name)
-    f.write(f"mtl {sanitized_material_name}\n")
-    f.write("shader a_n_rm 542d323fb6604f468eb8fd99b29502d8\n")
-    f.write("emissiveBlink false\n")
-    f.write("emissiveBlinkSpeed 0.000000\n")
-    f.write("emissiveLinkBuildingLight false\n")
-    f.write("uscrollanim false\n")
-    f.write("vscrollanim false\n")
-    f.write("scrollanimspeed 0.000000 0.000000\n")
-    f.write("uvstepanim false\n")
-    f.write("uvstepanimparam 1 1 0 1.000000\n")
-    f.write("sortindex 0\n")
-    f.write("castshadow true\n")
-    f.write("cull back\n")
-    f.write("drawOutline false\n")
-    f.write(f"outlineWidth {material.line_color[3]}\n")
-    f.write(f"outlineColor {material.line_color[0]} {material.line_color[1]} {material.line_color[2]} 1.000000\n")
-    f.write("overrideOutlineSetting false\n")
-    f.write("distanceFade false\n")
-    f.write("uvofs 0.000000 0.000000\n")
-    f.write("uvscl 1.000000 1.000000\n")
-    f.write("RenderingType Cutoff\n")
-    f.write(f"RMMap {mask_map_filename}0001.png\n")
-    
-    if material.use_nodes:
-        for node in material.node_tree.nodes:
-            if node.type == 'BSDF_PRINCIPLED':
-                for input in node.inputs:
-                    if input.is_linked:
-                        for link in material.node_tree.links:
-                            if link.to_socket == input:
-                                texture_node = find_texture_node(link.from_node)
-                                if texture_node and hasattr(texture_node, 'image') and texture_node.image:
-                                    filename = sanitize_filename(texture_node.image.name.replace(' ', '_')) + ".png"
-                                    if input.name in texture_dict:
-                                        f.write(f"{texture_dict[input.name]} {filename}\n")
-    
-    f.write(f"LitColor {material.diffuse_color[0]} {material.diffuse_color[1]} {material.diffuse_color[2]} 1.000000\n")
-    f.write("ShadeColor 0.600000 0.600000 0.600000 1.000000\n")
-    f.write("toony 0.900000\n")
-    f.write("shift 0.000000\n")
-    f.write("LitShaderMixTexMult 0.000000\n")
-    f.write("lightColorAtt 0.000000\n")
-    f.write("EmissionInt 1.000000\n")
-    f.write("matCapScale 1.000000\n")
-    f.write("Rim 0.000000 0.000000 0.000000\n")
-    f.write("RimInt 1.000000\n")
-    f.write("RimLightingMix 0.000000\n")
-    f.write("RimFresnelPow 0.000000\n")
-    f.write("RimLift 0.000000\n")
-    f.write("cutOffThreshold 0.600000\n")
-    f.write("outlineType World\n")
-    f.write("outlineMaxScale 1.000000\n")
-    f.write("outlineMixLighting 0.000000\n")
-    f.write("UVRotateAnimation 0.000000\n")
-    f.write("\n")
+    record = [
+        ('mtl', sanitized_material_name),
+        ('shader', "a_n_rm 542d323fb6604f468eb8fd99b29502d8"),
+        ('emissiveBlink', "false"),
+        ('emissiveBlinkSpeed', "0.000000"),
+        ('emissiveLinkBuildingLight', "false"),
+        ('uscrollanim', "false"),
+        ('vscrollanim', "false"),
+        ('scrollanimspeed', "0.000000 0.000000"),
+        ('uvstepanim', "false"),
+        ('uvstepanimparam', "1 1 0 1.000000"),
+        ('sortindex', "0"),
+        ('castshadow', "true"),
+        ('cull', "back"),
+        ('drawOutline', "false"),
+        ('outlineWidth', f"{material.line_color[3]}"),
+        ('outlineColor', f"{material.line_color[0]} {material.line_color[1]} {material.line_color[2]} 1.000000"),
+        ('overrideOutlineSetting', "false"),
+        ('distanceFade', "false"),
+        ('uvofs', "0.000000 0.000000"),
+        ('uvscl', "1.000000 1.000000"),
+        ('RenderingType', "Cutoff"),
+        ('RMMap', f"{mask_map_filename}.png"),
+    ]
+
+    entry = material_entry if material_entry is not None else index_material(material)
+    for input_name, image in entry['textures']:
+        if input_name in texture_dict:
+            record.append((texture_dict[input_name], texture_filename(image, texture_filenames)))
+
+    record += [
+        ('LitColor', f"{material.diffuse_color[0]} {material.diffuse_color[1]} {material.diffuse_color[2]} 1.000000"),
+        ('ShadeColor', "0.600000 0.600000 0.600000 1.000000"),
+        ('toony', "0.900000"),
+        ('shift', "0.000000"),
+        ('LitShaderMixTexMult', "0.000000"),
+        ('lightColorAtt', "0.000000"),
+        ('EmissionInt', "1.000000"),
+        ('matCapScale', "1.000000"),
+        ('Rim', "0.000000 0.000000 0.000000"),
+        ('RimInt', "1.000000"),
+        ('RimLightingMix', "0.000000"),
+        ('RimFresnelPow', "0.000000"),
+        ('RimLift', "0.000000"),
+        ('cutOffThreshold', "0.600000"),
+        ('outlineType', "World"),
+        ('outlineMaxScale', "1.000000"),
+        ('outlineMixLighting', "0.000000"),
+        ('UVRotateAnimation', "0.000000"),
+    ]
+    return record
+
+def render_def_record(record):
+    return "".join(f"{key} {value}\n" for key, value in record) + "\n"
+
+def parse_def_file(text):
+    # Material blocks of a .def as {material name: [(key, value), ...]}; each block starts at its "mtl" line
+    records = {}
+    record = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        key, _, value = line.partition(' ')
+        if key == 'mtl':
+            record = [(key, value)]
+            records[value] = record
+        elif record is not None:
+            record.append((key, value))
+    return records
+
+def read_def_file(filepath):
+    try:
+        with open(filepath, 'r') as f:
+            return parse_def_file(f.read())
+    except (OSError, UnicodeDecodeError):
+        return {}
+
+def merge_def_record(record, existing=None, last=None):
+    # Keys the exporter derives from the material are updated; every other key keeps its value from
+    # the existing .def, and keys added there by hand are kept at the end of the block.
+    # Outline keys are updated only if they differ from what the last export (last) wrote for them,
+    # i.e. the material's line colour changed; otherwise a width or colour tuned in BAKIN is kept.
+    if not existing:
+        return record
+    previous = dict(existing)
+    last_values = dict(last) if last else {}
+    updated = DEF_GENERATED_KEYS | {
+        key for key, value in record if key in DEF_OUTLINE_KEYS and key in last_values and last_values[key] != value
+    }
+    merged = [
+        (key, value if key in updated or key not in previous else previous[key])
+        for key, value in record
+    ]
+    keys = {key for key, value in record}
+    merged += [(key, value) for key, value in existing if key not in keys and key not in DEF_GENERATED_KEYS]
+    return merged
 
 def register():
     bpy.types.Scene.model_name = bpy.props.StringProperty(
@@ -456,6 +2593,135 @@ def register():
         description="Invert the Specular texture.",
         default=False
     )
+    bpy.types.Scene.use_export_cache = bpy.props.BoolProperty(
+        name="Skip Unchanged Files",
+        description="Only rewrite textures, mask maps, FBX and .def blocks whose source data changed since the last export.",
+        default=True
+    )
+    bpy.types.Scene.texture_threads = bpy.props.IntProperty(
+        name="Texture Threads",
+        description="Worker threads encoding textures and mask maps. 0 uses one per CPU core.",
+        default=0,
+        min=0,
+        max=64
+    )
+    bpy.types.Scene.texture_memory_limit = bpy.props.IntProperty(
+        name="Texture Memory (MB)",
+        description="Maximum size of the pixel buffers waiting to be encoded at any time.",
+        default=1024,
+        min=64
+    )
+    bpy.types.Scene.mask_map_tile_budget = bpy.props.IntProperty(
+        name="Mask Map Tile Budget (MB)",
+        description="Mask maps that would need more memory than this are packed and written in bands of rows. 0 packs every mask map in one go.",
+        default=256,
+        min=0
+    )
+    bpy.types.Scene.trace_export_memory = bpy.props.BoolProperty(
+        name="Trace Memory per Phase",
+        description="Also record the peak traced memory of each phase in the export report and summary. The export runs several times slower.",
+        default=False
+    )
+    bpy.types.Scene.max_texture_size = bpy.props.IntProperty(
+        name="Max Texture Size",
+        description="Textures and mask maps larger than this (in pixels, on their longest side) are scaled down on export. 0 keeps every texture at its own size.",
+        default=0,
+        min=0,
+        max=16384
+    )
+    bpy.types.Scene.use_power_of_two_textures = bpy.props.BoolProperty(
+        name="Power of Two Sizes",
+        description="Snap the width and height of exported textures and mask maps to the nearest power of two.",
+        default=False
+    )
+    bpy.types.Material.bakin_max_texture_size = bpy.props.IntProperty(
+        name="Max Texture Size",
+        description="Texture size limit for this material's textures and mask map. 0 uses the export's Max Texture Size.",
+        default=0,
+        min=0,
+        max=16384
+    )
+    bpy.types.Scene.use_texture_atlas = bpy.props.BoolProperty(
+        name="Texture Atlases",
+        description="Pack the textures of materials with the same .def settings into shared atlases so Bakin draws them in one call.",
+        default=False
+    )
+    bpy.types.Scene.atlas_max_size = bpy.props.IntProperty(
+        name="Atlas Size",
+        description="Largest width and height of a texture atlas, in pixels.",
+        default=4096,
+        min=256,
+        max=16384
+    )
+    bpy.types.Scene.use_vertex_cache_optimization = bpy.props.BoolProperty(
+        name="Optimize Vertex Cache",
+        description="Reorder triangles and vertices of the exported meshes so the GPU reuses more transformed vertices. The shape of the model does not change.",
+        default=False
+    )
+    bpy.types.Scene.use_lod = bpy.props.BoolProperty(
+        name="LOD Chain",
+        description="Also export decimated copies of the model as <model>_LOD1.fbx, _LOD2.fbx... each with its own .def.",
+        default=False
+    )
+    bpy.types.Scene.lod_ratios = bpy.props.StringProperty(
+        name="LOD Ratios",
+        description="Comma separated share of triangles kept by each LOD, e.g. 0.5, 0.25, 0.1.",
+        default="0.5, 0.25, 0.1"
+    )
+    bpy.types.Scene.lod_min_triangles = bpy.props.IntProperty(
+        name="Minimum Triangles",
+        description="Meshes are never decimated below this many triangles, so small props keep their shape.",
+        default=32,
+        min=0
+    )
+    bpy.types.Scene.bake_anim = bpy.props.BoolProperty(
+        name="Bake Animation",
+        description="Export animations in the FBX.",
+        default=True
+    )
+    bpy.types.Scene.bake_anim_step = bpy.props.FloatProperty(
+        name="Sampling Rate",
+        description="How often animations are sampled when baked into the FBX, in frames. Higher values make smaller files.",
+        default=1.0,
+        min=0.01,
+        max=100.0
+    )
+    bpy.types.Scene.bake_anim_simplify_factor = bpy.props.FloatProperty(
+        name="Simplify",
+        description="How much the FBX exporter simplifies baked animation curves. 0 keeps every sample; higher values make smaller files.",
+        default=1.0,
+        min=0.0,
+        max=100.0
+    )
+    bpy.types.Scene.use_keyframe_reduction = bpy.props.BoolProperty(
+        name="Reduce Keyframes",
+        description="Remove keyframes that linear interpolation can rebuild within the tolerance before the FBX is written.",
+        default=False
+    )
+    bpy.types.Scene.keyframe_tolerance = bpy.props.FloatProperty(
+        name="Tolerance",
+        description="Largest allowed difference between the original and the reduced animation curves (in the curve's own units: meters, radians...).",
+        default=0.001,
+        min=0.0,
+        max=1.0,
+        precision=4
+    )
+    bpy.types.Scene.merge_def_file = bpy.props.BoolProperty(
+        name="Keep .def Edits",
+        description="Merge with the existing .def: textures, mask map and colours are updated from the materials, the outline only when the material's line colour changed, and every other setting edited in the .def (cull, RenderingType, outline, rim...) is kept.",
+        default=True
+    )
+    bpy.types.Scene.use_modal_export = bpy.props.BoolProperty(
+        name="Export in Background",
+        description="Keep Blender responsive while exporting, with a progress bar in the panel. Press Esc to cancel.",
+        default=True
+    )
+    bpy.types.WindowManager.bakin_export_running = bpy.props.BoolProperty(default=False)
+    bpy.types.WindowManager.bakin_export_cancel = bpy.props.BoolProperty(default=False)
+    bpy.types.WindowManager.bakin_export_progress = bpy.props.FloatProperty(default=0.0, min=0.0, max=1.0, subtype='FACTOR')
+    bpy.types.WindowManager.bakin_export_phase = bpy.props.StringProperty(default="")
+    bpy.types.WindowManager.bakin_export_summary = bpy.props.StringProperty(default="")
+    bpy.types.WindowManager.bakin_export_check = bpy.props.StringProperty(default="")
     bpy.types.Scene.language = bpy.props.EnumProperty(
         name="Language",
         description="Choose the UI language.",
@@ -463,7 +2729,11 @@ def register():
     )
     bpy.utils.register_class(SimpleOperatorPanel)
     bpy.utils.register_class(ExportFBXOperator)
+    bpy.utils.register_class(CancelExportOperator)
+    bpy.utils.register_class(CheckSceneOperator)
     bpy.utils.register_class(SwitchLanguageOperator)
+    for name, handler in WEIGHT_DIGEST_HANDLERS:
+        getattr(bpy.app.handlers, name).append(handler)
 
 def unregister():
     del bpy.types.Scene.model_name
@@ -471,10 +2741,46 @@ def unregister():
     del bpy.types.Scene.invert_metallic
     del bpy.types.Scene.invert_emissive
     del bpy.types.Scene.invert_specular
+    del bpy.types.Scene.use_export_cache
+    del bpy.types.Scene.texture_threads
+    del bpy.types.Scene.texture_memory_limit
+    del bpy.types.Scene.mask_map_tile_budget
+    del bpy.types.Scene.trace_export_memory
+    del bpy.types.Scene.max_texture_size
+    del bpy.types.Scene.use_power_of_two_textures
+    del bpy.types.Material.bakin_max_texture_size
+    del bpy.types.Scene.use_texture_atlas
+    del bpy.types.Scene.atlas_max_size
+    del bpy.types.Scene.use_vertex_cache_optimization
+    del bpy.types.Scene.use_lod
+    del bpy.types.Scene.lod_ratios
+    del bpy.types.Scene.lod_min_triangles
+    del bpy.types.Scene.bake_anim
+    del bpy.types.Scene.bake_anim_step
+    del bpy.types.Scene.bake_anim_simplify_factor
+    del bpy.types.Scene.use_keyframe_reduction
+    del bpy.types.Scene.keyframe_tolerance
+    del bpy.types.Scene.merge_def_file
+    del bpy.types.Scene.use_modal_export
+    del bpy.types.WindowManager.bakin_export_running
+    del bpy.types.WindowManager.bakin_export_cancel
+    del bpy.types.WindowManager.bakin_export_progress
+    del bpy.types.WindowManager.bakin_export_phase
+    del bpy.types.WindowManager.bakin_export_summary
+    del bpy.types.WindowManager.bakin_export_check
     del bpy.types.Scene.language
     bpy.utils.unregister_class(SimpleOperatorPanel)
     bpy.utils.unregister_class(ExportFBXOperator)
+    bpy.utils.unregister_class(CancelExportOperator)
+    bpy.utils.unregister_class(CheckSceneOperator)
     bpy.utils.unregister_class(SwitchLanguageOperator)
+    for name, handler in WEIGHT_DIGEST_HANDLERS:
+        if handler in getattr(bpy.app.handlers, name):
+            getattr(bpy.app.handlers, name).remove(handler)
+    _weight_digests.clear()
 
 if __name__ == "__main__":
     register()
+    # Run as a script by a background Blender with arguments after "--": export and quit
+    if bpy.app.background and "--" in sys.argv:
+        sys.exit(export_cli())